@@ -0,0 +1,166 @@
+"""
+Admission Control
+
+This module sheds load before it reaches the database. Each client gets a
+token bucket (429 Too Many Requests when it runs dry) and the number of
+requests in flight is capped at the size of the SQLAlchemy pool. A request
+that cannot get a slot within the queue budget is turned away with
+503 Service Unavailable instead of waiting on a pool checkout until
+gunicorn times it out. Both responses carry a Retry-After header.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import abort, g, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+from service import app
+from service.models import db
+from . import status
+from .batch import is_batched
+
+# Endpoints that never touch the database are always admitted, and so are
+# the change feed's long-polls and streams, which sleep without a connection
+EXEMPT_ENDPOINTS = {
+    "healthcheck",
+    "readiness_check",
+    "index",
+    "static",
+    "static_asset",
+    "list_product_changes",
+    "profile_worker",
+    "stream_product_changes",
+}
+
+
+class TokenBucket:
+    """Refills at rate tokens per second up to capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Takes a token, returning 0 or the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """Rate limits clients and caps the number of requests in flight"""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        max_concurrency: int,
+        queue_timeout_ms: int,
+        max_clients: int = 10000,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout_ms / 1000.0
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def check_rate(self, client: str) -> float:
+        """Returns 0 if the client may proceed, else seconds to wait"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+            return bucket.take()
+
+    def acquire(self) -> bool:
+        """Waits up to the queue budget for a free slot"""
+        return self._slots.acquire(timeout=self.queue_timeout)
+
+    def release(self):
+        """Returns a slot taken by acquire()"""
+        self._slots.release()
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_controller() -> AdmissionController:
+    """Returns the app's controller, sizing it from the pool on first use"""
+    global _controller  # pylint: disable=global-statement
+    with _controller_lock:
+        if _controller is None:
+            max_concurrency = app.config.get("ADMISSION_MAX_CONCURRENCY") or getattr(
+                db.engine.pool, "size", lambda: 5
+            )()
+            _controller = AdmissionController(
+                rate=app.config.get("ADMISSION_RATE_PER_SEC", 0),
+                burst=app.config.get("ADMISSION_BURST", 20),
+                max_concurrency=max_concurrency,
+                queue_timeout_ms=app.config.get("ADMISSION_QUEUE_TIMEOUT_MS", 100),
+            )
+            app.logger.info("Admission control allows %d requests in flight", max_concurrency)
+        return _controller
+
+
+def client_id() -> str:
+    """Identifies the client by the address its connection came from"""
+    return request.remote_addr or "unknown"
+
+
+# Behind PROXY_TRUSTED_HOPS reverse proxies, remote_addr becomes the address
+# the outermost of them saw; whatever a client wrote into X-Forwarded-For
+# itself is further left in the header and never read
+if app.config.get("PROXY_TRUSTED_HOPS", 0):
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_TRUSTED_HOPS"])
+
+
+######################################################################
+# Admit or shed every request before it reaches a route
+######################################################################
+@app.before_request
+def admit_request():
+    """Rejects the request early if the client or the service is overloaded"""
+    if request.endpoint in EXEMPT_ENDPOINTS or is_batched():
+        return
+    controller = get_controller()
+    wait = controller.check_rate(client_id())
+    if wait:
+        abort(
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            "Rate limit exceeded, slow down.",
+            retry_after=math.ceil(wait),
+        )
+    if not controller.acquire():
+        abort(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            "Service is overloaded, try again shortly.",
+            retry_after=1,
+        )
+    g.admitted = True
+
+
+@app.teardown_request
+def release_request(_error=None):
+    """Frees the request's slot however the request ended"""
+    if is_batched():
+        return  # batch operations share the batch's slot (and its g)
+    if g.pop("admitted", False):
+        get_controller().release()
@@ -0,0 +1,163 @@
+"""
+Product Archival
+
+This module moves soft-deleted Products, and Products that have been
+unavailable for a long time, out of the hot product table into
+product_archive. Rows are moved in small batches, each in its own
+transaction, with a pause between batches so the archiver never holds
+long locks or saturates the database.
+
+The archiver runs from ``flask products-archive`` or, when
+ARCHIVE_ENABLED is set, on a background thread in every worker. On
+Postgres, FOR UPDATE SKIP LOCKED keeps concurrent archivers from
+fighting over the same rows.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, literal, or_, select
+from service import app
+from service.models import db, Product, ProductArchive, ProductChange, lock_change_feed
+from . import shared_cache
+
+ARCHIVED_COLUMNS = (
+    "id", "name", "description", "price", "available", "category", "last_modified", "deleted_at"
+)
+
+
+def archive_candidates(unavailable_days: int, batch_size: int) -> list:
+    """Returns the ids of up to batch_size rows that should be archived"""
+    product = Product.__table__
+    cutoff = datetime.utcnow() - timedelta(days=unavailable_days)
+    statement = (
+        select(product.c.id)
+        .where(
+            or_(
+                product.c.deleted_at.is_not(None),
+                (product.c.available.is_(False)) & (product.c.last_modified < cutoff),
+            )
+        )
+        .order_by(product.c.id)
+        .limit(batch_size)
+    )
+    if db.engine.dialect.name == "postgresql":
+        statement = statement.with_for_update(skip_locked=True)
+    return list(db.session.execute(statement).scalars())
+
+
+def archive_batch(ids: list) -> int:
+    """Moves the given rows to the archive in the current transaction"""
+    product, archive = Product.__table__, ProductArchive.__table__
+    columns = [product.c[name] for name in ARCHIVED_COLUMNS]
+    db.session.execute(
+        insert(archive).from_select(
+            ARCHIVED_COLUMNS + ("archived_at",),
+            select(*columns, literal(datetime.utcnow())).where(product.c.id.in_(ids)),
+        )
+    )
+    # deletes already published a tombstone; unavailable rows publish "archive"
+    lock_change_feed(db.session.connection())
+    db.session.execute(
+        insert(ProductChange.__table__).from_select(
+            ("product_id", "operation", "changed_at"),
+            select(product.c.id, literal("archive"), literal(datetime.utcnow())).where(
+                product.c.id.in_(ids), product.c.deleted_at.is_(None)
+            ),
+        )
+    )
+    db.session.execute(delete(product).where(product.c.id.in_(ids)))
+    return len(ids)
+
+
+def archive_products(
+    batch_size: int = 1000,
+    unavailable_days: int = 180,
+    pause: float = 0.1,
+    max_batches: int = None,
+    progress=None,
+) -> int:
+    """Archives eligible Products batch by batch
+
+    :param pause: seconds to sleep between batches to throttle the load
+    :param max_batches: stop after this many batches (None for no limit)
+    :param progress: optional callable given the running total
+
+    :return: the number of Products archived
+    :rtype: int
+
+    """
+    total, batches = 0, 0
+    while max_batches is None or batches < max_batches:
+        try:
+            ids = archive_candidates(unavailable_days, batch_size)
+            if not ids:
+                db.session.commit()
+                break
+            total += archive_batch(ids)
+            db.session.commit()
+            cache = shared_cache.get_cache()
+            for product_id in ids if cache else ():
+                cache.invalidate(product_id)
+        except Exception:
+            db.session.rollback()
+            raise
+        batches += 1
+        if progress:
+            progress(total)
+        if len(ids) < batch_size:
+            break
+        time.sleep(pause)
+    if total:
+        app.logger.info("Archived %d products", total)
+    return total
+
+
+class ArchiveRunner:
+    """Runs the archiver on a background thread every interval seconds"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the background thread"""
+        self._thread = threading.Thread(target=self._run, name="archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Asks the background thread to finish"""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with app.app_context():
+                try:
+                    archive_products(
+                        batch_size=app.config.get("ARCHIVE_BATCH_SIZE", 1000),
+                        unavailable_days=app.config.get("ARCHIVE_UNAVAILABLE_DAYS", 180),
+                        pause=app.config.get("ARCHIVE_PAUSE_MS", 100) / 1000.0,
+                    )
+                except Exception as error:  # pylint: disable=broad-except
+                    app.logger.error("Archival failed: %s", error)
+                finally:
+                    db.session.remove()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+######################################################################
+# Start the scheduled archiver in each worker on its first request
+######################################################################
+@app.before_request
+def start_archiver():
+    """Starts the background archiver once, after the worker has forked"""
+    global _runner  # pylint: disable=global-statement
+    if _runner is not None or not app.config.get("ARCHIVE_ENABLED"):
+        return
+    with _runner_lock:
+        if _runner is None:
+            _runner = ArchiveRunner(app.config.get("ARCHIVE_INTERVAL_SECONDS", 3600))
+            _runner.start()
@@ -0,0 +1,190 @@
+"""
+Batch Requests
+
+This module runs many API calls that arrive in one POST /batch. Every
+operation is dispatched in-process through the normal routes, so it gets
+the same validation, error handlers and JSON as a direct call, without an
+HTTP round trip (or admission check) of its own.
+
+Writes run in order on the batch's database session. With "atomic" they
+share one transaction that is rolled back if any operation fails. Runs of
+consecutive GETs in a non-atomic batch are independent of each other, so
+they are fanned out over a small thread pool.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from service import app
+from service.models import db, DataValidationError, lock_change_feed
+from . import shared_cache
+
+logger = logging.getLogger("flask.app")
+
+METHODS = ("GET", "POST", "PUT", "DELETE")
+
+# Set in the environ of every operation so hooks can tell it from a real request
+ENVIRON_KEY = "service.batch"
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Returns the pool that runs concurrent reads, creating it on first use"""
+    global _executor  # pylint: disable=global-statement
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config.get("BATCH_MAX_WORKERS", 4),
+            thread_name_prefix="batch",
+        )
+    return _executor
+
+
+def is_batched() -> bool:
+    """Returns True while handling one operation of a batch"""
+    return has_request_context() and request.environ.get(ENVIRON_KEY, False)
+
+
+def parse_operations(data) -> tuple:
+    """Validates a batch body and returns (operations, atomic)
+
+    :param data: {"operations": [{"method", "path", "body"}, ...], "atomic": bool}
+
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("operations"), list):
+        raise DataValidationError("Batch body must be an object with an operations list")
+    operations = data["operations"]
+    limit = app.config.get("BATCH_MAX_OPERATIONS", 50)
+    if not operations or len(operations) > limit:
+        raise DataValidationError(f"A batch must hold between 1 and {limit} operations")
+    for number, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise DataValidationError(f"Operation {number} must be an object")
+        method = str(operation.get("method", "GET")).upper()
+        path = operation.get("path")
+        if method not in METHODS:
+            raise DataValidationError(f"Operation {number} has unsupported method {method}")
+        if not isinstance(path, str) or not path.startswith("/") or path.startswith("/batch"):
+            raise DataValidationError(f"Operation {number} has an invalid path")
+        operation["method"] = method
+    atomic = data.get("atomic", False)
+    if not isinstance(atomic, bool):
+        raise DataValidationError("atomic must be true or false")
+    return operations, atomic
+
+
+def dispatch(operation: dict) -> dict:
+    """Runs one operation through the app and returns its status and body"""
+    with app.test_request_context(
+        operation["path"],
+        method=operation["method"],
+        json=operation.get("body"),
+        environ_base={ENVIRON_KEY: True},
+    ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as error:  # pylint: disable=broad-except
+            logger.exception("Batch operation %s %s failed", operation["method"], operation["path"])
+            db.session.rollback()
+            return {"status": 500, "body": {"error": "Internal Server Error", "message": str(error)}}
+        result = {"status": response.status_code, "body": response.get_json(silent=True)}
+        if result["body"] is None and response.data:
+            result["body"] = response.get_data(as_text=True)
+        if "Location" in response.headers:
+            result["location"] = response.headers["Location"]
+        return result
+
+
+def dispatch_read(operation: dict) -> dict:
+    """Runs a read in its own app context (and so its own session)"""
+    with app.app_context():
+        return dispatch(operation)
+
+
+@contextmanager
+def atomic_session():
+    """Binds the scoped session to one transaction for the whole batch
+
+    Operations still call commit(), which only releases a savepoint. The
+    caller commits the yielded transaction; anything else rolls it back.
+    """
+    connection = db.engine.connect()
+    sqlite = connection.dialect.name == "sqlite"
+    if sqlite:
+        # pysqlite commits on its own around SAVEPOINT, so take over BEGIN; the
+        # batch will write, so it takes the write lock before its first read
+        driver_connection = connection.connection.driver_connection
+        isolation_level = driver_connection.isolation_level
+        driver_connection.isolation_level = None
+        event.listen(connection, "begin", lambda conn: conn.exec_driver_sql("BEGIN IMMEDIATE"))
+    transaction = connection.begin()
+    # the batch writes over several flushes; holding the change feed lock
+    # from its first change row only, a later operation could wait on a row
+    # of a writer that is itself queued on the lock, so take it up front
+    lock_change_feed(connection)
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+    # the request's own session is put back afterwards, not orphaned mid-transaction
+    previous = db.session.registry() if db.session.registry.has() else None
+    db.session.registry.set(session)
+    g.atomic_batch = True
+    try:
+        yield transaction
+    finally:
+        g.pop("atomic_batch", None)
+        session.close()
+        if transaction.is_active:
+            transaction.rollback()
+        if sqlite:
+            driver_connection.isolation_level = isolation_level
+        connection.close()
+        if previous is None:
+            db.session.registry.clear()
+        else:
+            previous.expire_all()  # the batch may have changed what it holds
+            db.session.registry.set(previous)
+
+
+def run_atomic(operations: list) -> tuple:
+    """Runs the operations in one transaction, stopping at the first failure"""
+    results = []
+    with atomic_session() as transaction:
+        for operation in operations:
+            results.append(dispatch(operation))
+            if results[-1]["status"] >= 400:
+                break
+        committed = len(results) == len(operations) and results[-1]["status"] < 400
+        if committed:
+            transaction.commit()
+            shared_cache.invalidate_committed(transaction.connection)
+    # operations after a failure never ran
+    results += [{"status": 424, "body": None}] * (len(operations) - len(results))
+    return results, committed
+
+
+def run_reads(operations: list, indexes: list, results: list):
+    """Runs a run of independent GETs, concurrently when there is more than one"""
+    if len(indexes) > 1:
+        futures = [get_executor().submit(dispatch_read, operations[i]) for i in indexes]
+        for i, future in zip(indexes, futures):
+            results[i] = future.result()
+    elif indexes:
+        results[indexes[0]] = dispatch(operations[indexes[0]])
+
+
+def run_batch(operations: list, atomic: bool) -> tuple:
+    """Runs the operations and returns (results, committed)"""
+    if atomic:
+        return run_atomic(operations)
+    results = [None] * len(operations)
+    reads = []
+    for index, operation in enumerate(operations):
+        if operation["method"] == "GET":
+            reads.append(index)
+            continue
+        run_reads(operations, reads, results)
+        reads = []
+        results[index] = dispatch(operation)
+    run_reads(operations, reads, results)
+    return results, True
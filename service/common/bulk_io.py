@@ -0,0 +1,238 @@
+"""
+Bulk Import and Export
+
+This module streams Products between the database and CSV or NDJSON
+files in fixed-size chunks so memory stays bounded however large the
+file is. Postgres uses COPY; other databases fall back to a chunked
+executemany insert.
+
+Bulk loads bypass the ORM, so they write their own "create" entries to
+the change feed, in the same transaction as the rows.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import cast, column, insert, select, table as sql_table
+from service.models import db, Product, DataValidationError, record_created
+
+FIELDS = ("id", "name", "description", "price", "available", "category")
+COLUMNS = ("name", "description", "price", "available", "category", "last_modified")
+FORMATS = ("csv", "ndjson")
+
+# Per-connection temporary table that COPY loads before the INSERT ... RETURNING
+STAGING_TABLE = "product_load"
+
+
+def detect_format(path: str, fmt: str = None) -> str:
+    """Returns the file format from an explicit choice or the extension"""
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".")).lower()
+    if fmt in ("jsonl", "json"):
+        fmt = "ndjson"
+    if fmt not in FORMATS:
+        raise DataValidationError(f"Unsupported format '{fmt}', use csv or ndjson")
+    return fmt
+
+
+def parse_bool(value) -> bool:
+    """Parses the boolean spellings used by CSV files and COPY"""
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("true", "t", "1", "yes", "y"):
+        return True
+    if text in ("false", "f", "0", "no", "n"):
+        return False
+    raise DataValidationError(f"Invalid value for boolean [available]: {value}")
+
+
+def read_records(file, fmt: str):
+    """Yields (line number, record) pairs from a CSV or NDJSON file"""
+    if fmt == "csv":
+        reader = csv.DictReader(file)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    yield from parse_lines(file)
+
+
+def parse_lines(lines):
+    """Yields (line number, record) pairs from NDJSON lines, skipping blank ones"""
+    for line_no, line in enumerate(lines, start=1):
+        if isinstance(line, Exception):
+            yield line_no, line
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as error:
+            yield line_no, error
+
+
+def read_lines(stream, max_bytes: int):
+    """Yields the lines of a binary stream holding no more than one line in memory
+
+    A line longer than max_bytes is skipped and yields a DataValidationError.
+    """
+    while True:
+        line = stream.readline(max_bytes + 1)
+        if not line:
+            return
+        if len(line) > max_bytes and not line.endswith(b"\n"):
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_bytes + 1)
+            yield DataValidationError(f"Line is longer than {max_bytes} bytes")
+            continue
+        yield line
+
+
+def validate_record(record) -> dict:
+    """Validates a record through Product.deserialize and returns its row"""
+    if isinstance(record, DataValidationError):
+        raise record
+    if isinstance(record, Exception):
+        raise DataValidationError(f"Invalid JSON: {record}")
+    if not isinstance(record, dict):
+        raise DataValidationError("Invalid product: record is not an object")
+    data = dict(record)
+    if "available" in data:
+        data["available"] = parse_bool(data["available"])
+    product = Product().deserialize(data)
+    return {
+        "name": product.name,
+        "description": product.description,
+        "price": product.price,
+        "available": product.available,
+        "category": product.category.name,
+    }
+
+
+def validate_chunk(chunk: list) -> tuple:
+    """Returns the valid rows of a chunk of (line number, record) pairs
+
+    :return: (rows, {line number: error message} of the rejected records)
+    :rtype: tuple
+
+    """
+    rows, errors = [], {}
+    for line_no, record in chunk:
+        try:
+            rows.append(validate_record(record))
+        except DataValidationError as error:
+            errors[line_no] = str(error)
+    return rows, errors
+
+
+def chunked(iterable, size: int):
+    """Yields lists of up to size items"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def copy_supported() -> bool:
+    """Returns True when the database can load rows with COPY"""
+    return db.engine.dialect.name == "postgresql"
+
+
+def insert_rows(rows: list) -> int:
+    """Inserts validated rows in the current transaction
+
+    Uses COPY FROM STDIN on Postgres and executemany everywhere else. The
+    inserted rows come back through RETURNING so each one also gets its
+    "create" entry in the change feed.
+    """
+    if not rows:
+        return 0
+    now = datetime.utcnow()
+    table = Product.__table__
+    connection = db.session.connection()
+    returned = [table.c[name] for name in FIELDS]
+    if copy_supported():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row["name"], row["description"], row["price"],
+                             row["available"], row["category"], now])
+        buffer.seek(0)
+        connection.exec_driver_sql(
+            f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} ("
+            "name text, description text, price numeric, available boolean, "
+            "category text, last_modified timestamp) ON COMMIT DELETE ROWS"
+        )
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(
+            f"COPY {STAGING_TABLE} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+        staging = sql_table(STAGING_TABLE, *[column(name) for name in COLUMNS])
+        loaded = [
+            cast(staging.c[name], table.c[name].type) if name == "category" else staging.c[name]
+            for name in COLUMNS
+        ]
+        statement = insert(table).from_select(COLUMNS, select(*loaded)).returning(*returned)
+        inserted = connection.execute(statement).all()
+        connection.exec_driver_sql(f"TRUNCATE {STAGING_TABLE}")
+    else:
+        inserted = connection.execute(
+            insert(table).returning(*returned),
+            [{**{name: row[name] for name in COLUMNS[:-1]}, "last_modified": now} for row in rows],
+        ).all()
+    record_created(connection, inserted)
+    return len(rows)
+
+
+def iter_rows(chunk_size: int = 10000):
+    """Streams every live (not soft deleted) Product row as a dictionary in id order"""
+    table = Product.__table__
+    statement = (
+        select(*[table.c[name] for name in FIELDS])
+        .where(table.c.deleted_at.is_(None))
+        .order_by(table.c.id)
+    )
+    result = db.session.execute(statement.execution_options(yield_per=chunk_size))
+    for row in result.mappings():
+        yield {
+            "id": row["id"],
+            "name": row["name"],
+            "description": row["description"],
+            "price": str(row["price"]),
+            "available": row["available"],
+            "category": row["category"].name,
+        }
+
+
+def write_records(file, fmt: str, rows, header: bool = True) -> int:
+    """Writes rows to a CSV or NDJSON file and returns how many were written"""
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(file, fieldnames=FIELDS)
+        if header:
+            writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        return count
+    for row in rows:
+        file.write(json.dumps(row, default=str))
+        file.write("\n")
+        count += 1
+    return count
+
+
+def copy_out(file) -> int:
+    """Writes every live Product as CSV with Postgres COPY TO STDOUT"""
+    table = Product.__table__.name
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(
+        f"COPY (SELECT {', '.join(FIELDS)} FROM {table} WHERE deleted_at IS NULL ORDER BY id) "
+        "TO STDOUT WITH (FORMAT csv, HEADER)",
+        file,
+    )
+    return cursor.rowcount
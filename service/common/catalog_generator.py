@@ -0,0 +1,102 @@
+"""
+Synthetic Catalog Generator
+
+This module generates large, reproducible catalogs for scale testing.
+Rows follow skewed, realistic distributions rather than uniform noise:
+
+- categories are skewed (groceries dominate, a handful are UNKNOWN)
+- names are drawn from a Zipfian distribution over a per-category
+  vocabulary, so a few names are very common and most are rare
+- prices follow a per-category log-normal histogram, rounded to cents
+- each category has its own availability ratio
+
+The same seed always produces the same rows.
+"""
+import itertools
+import math
+import random
+from decimal import Decimal
+from service.models import Category
+
+# share of the catalog, median price, price spread, share available
+CATEGORY_PROFILES = {
+    Category.FOOD: (0.35, 6.0, 0.6, 0.95),
+    Category.CLOTHS: (0.25, 35.0, 0.7, 0.85),
+    Category.HOUSEWARES: (0.18, 25.0, 0.8, 0.90),
+    Category.TOOLS: (0.12, 45.0, 0.9, 0.80),
+    Category.AUTOMOTIVE: (0.08, 90.0, 1.0, 0.75),
+    Category.UNKNOWN: (0.02, 15.0, 1.2, 0.50),
+}
+
+ADJECTIVES = (
+    "Classic", "Organic", "Deluxe", "Compact", "Premium", "Basic", "Vintage", "Heavy Duty",
+    "Lightweight", "Eco", "Family Size", "Travel", "Pro", "Mini", "Ultra", "Handmade",
+    "Rustic", "Modern", "Smart", "Essential",
+)
+
+NOUNS = {
+    Category.FOOD: ("Bread", "Coffee", "Cheese", "Apples", "Pasta", "Rice", "Honey", "Tea",
+                    "Chocolate", "Olive Oil", "Cereal", "Yogurt", "Salsa", "Cookies", "Jam"),
+    Category.CLOTHS: ("T-Shirt", "Jeans", "Hat", "Jacket", "Socks", "Sweater", "Scarf", "Dress",
+                      "Shorts", "Hoodie", "Gloves", "Belt", "Skirt", "Boots", "Fedora"),
+    Category.HOUSEWARES: ("Mug", "Plate", "Lamp", "Towel", "Pillow", "Candle", "Vase", "Kettle",
+                          "Blanket", "Frying Pan", "Cutting Board", "Curtain", "Rug", "Clock", "Bowl"),
+    Category.TOOLS: ("Hammer", "Wrench", "Drill", "Saw", "Screwdriver", "Pliers", "Tape Measure",
+                     "Level", "Chisel", "Clamp", "Sander", "Toolbox", "Socket Set", "Ladder", "File"),
+    Category.AUTOMOTIVE: ("Wiper Blades", "Floor Mats", "Motor Oil", "Jumper Cables", "Tire Gauge",
+                          "Car Wax", "Seat Cover", "Air Filter", "Phone Mount", "Battery",
+                          "Spark Plugs", "Headlight", "Coolant", "Tow Strap", "Car Charger"),
+    Category.UNKNOWN: ("Widget", "Gadget", "Gizmo", "Thing", "Item", "Bundle", "Kit", "Sample",
+                       "Box", "Set", "Pack", "Assortment", "Misc", "Bits", "Odds"),
+}
+
+
+def zipf_cum_weights(size: int, exponent: float) -> list:
+    """Returns cumulative Zipf weights for ranks 1..size"""
+    return list(itertools.accumulate(1.0 / rank ** exponent for rank in range(1, size + 1)))
+
+
+class CatalogGenerator:
+    """Generates Product rows from a seed
+
+    Rows are dictionaries in the shape used by bulk_io, so they can be
+    written to CSV/NDJSON files or loaded straight into the database.
+    """
+
+    def __init__(self, seed: int = 42, zipf_exponent: float = 1.1):
+        self.rng = random.Random(seed)
+        self.categories = list(CATEGORY_PROFILES)
+        self.category_weights = list(
+            itertools.accumulate(profile[0] for profile in CATEGORY_PROFILES.values())
+        )
+        self.names = {}
+        self.name_weights = {}
+        for category in self.categories:
+            # names ordered by popularity: adjective-free first, then combinations
+            nouns = NOUNS[category]
+            names = list(nouns) + [f"{adj} {noun}" for adj in ADJECTIVES for noun in nouns]
+            self.names[category] = names
+            self.name_weights[category] = zipf_cum_weights(len(names), zipf_exponent)
+        self.next_id = 1
+
+    def rows(self, count: int):
+        """Yields count generated rows"""
+        rng = self.rng
+        remaining = count
+        while remaining > 0:
+            size = min(remaining, 10000)
+            categories = rng.choices(self.categories, cum_weights=self.category_weights, k=size)
+            for category in categories:
+                _, median, spread, available_ratio = CATEGORY_PROFILES[category]
+                name = rng.choices(self.names[category], cum_weights=self.name_weights[category])[0]
+                price = rng.lognormvariate(math.log(median), spread)
+                yield {
+                    "id": self.next_id,
+                    "name": name,
+                    "description": f"{name} from our {category.name.lower()} range",
+                    "price": Decimal(f"{max(price, 0.01):.2f}"),
+                    "available": rng.random() < available_ratio,
+                    "category": category.name,
+                }
+                self.next_id += 1
+            remaining -= size
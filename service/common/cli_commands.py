@@ -1,8 +1,18 @@
 """
 Flask CLI Command Extensions
 """
+import os
+import time
+import click
 from service import app
-from service.models import db
+from service.models import db, DataValidationError
+from service.common import bulk_io, jobs
+from service.common.archival import archive_products
+from service.common.catalog_generator import CatalogGenerator
+from service.common.migrations import migrate_products
+from service.common.partitioning import partition_products
+from service.common.query_benchmark import run_benchmark
+from service.common.static_assets import AssetPipeline
 
 
 ######################################################################
@@ -20,4 +30,245 @@ def db_create():
         db.session.commit()
         app.logger.info("Database recreated successfully.")
     except Exception as e:
-        app.logger.error(f"Error recreating database: {e}")
\ No newline at end of file
+        app.logger.error(f"Error recreating database: {e}")
+
+
+######################################################################
+# Command to bring an existing database up to the current schema
+# Usage: flask db-migrate
+######################################################################
+@app.cli.command("db-migrate")
+def db_migrate():
+    """
+    Creates missing tables and adds missing product columns, keeping the rows.
+    """
+    try:
+        db.create_all()
+        count = migrate_products(db.session)
+        app.logger.info(f"Database migrated ({count} idempotent statements).")
+    except Exception as error:
+        db.session.rollback()
+        raise click.ClickException(f"Error migrating database: {error}") from error
+
+
+######################################################################
+# Command to time the hot lookups: rebuilt Query vs cached vs prepared
+# Usage: flask db-benchmark [--iterations N]
+######################################################################
+@app.cli.command("db-benchmark")
+@click.option("--iterations", default=1000, show_default=True, help="Calls per lookup and way.")
+def db_benchmark(iterations):
+    """Times each hot Product lookup built as a Query, a cached statement and a prepared statement"""
+    results = run_benchmark(iterations)
+    if not results:
+        click.echo("No products to look up; run products-generate first.", err=True)
+        return
+    baselines = {lookup: micros for lookup, way, micros in results if way == "query"}
+    click.echo(f"{'lookup':<22}{'way':<10}{'us/call':>10}{'vs query':>10}")
+    for lookup, way, micros in results:
+        click.echo(f"{lookup:<22}{way:<10}{micros:>10.1f}{micros / baselines[lookup]:>9.2f}x")
+
+
+######################################################################
+# Command to generate a synthetic catalog for scale testing
+# Usage: flask products-generate <count> [--seed N] [--output <file>]
+######################################################################
+@app.cli.command("products-generate")
+@click.argument("count", type=int)
+@click.option("--seed", default=42, show_default=True, help="Same seed, same catalog.")
+@click.option("--output", type=click.Path(dir_okay=False, writable=True),
+              help="Write CSV/NDJSON here instead of the database.")
+@click.option("--format", "fmt", type=click.Choice(bulk_io.FORMATS), help="Defaults to the file extension.")
+@click.option("--chunk-size", default=20000, show_default=True, help="Rows per transaction or write.")
+def products_generate(count, seed, output, fmt, chunk_size):
+    """
+    Generates COUNT realistic products into the database or a file.
+    """
+    rows = CatalogGenerator(seed).rows(count)
+    started = time.monotonic()
+    written = 0
+    if output:
+        try:
+            fmt = bulk_io.detect_format(output, fmt)
+        except DataValidationError as error:
+            raise click.UsageError(str(error)) from error
+        with open(output, "w", newline="", encoding="utf-8") as file:
+            for chunk in bulk_io.chunked(rows, chunk_size):
+                written += bulk_io.write_records(file, fmt, chunk, header=written == 0)
+                report_progress(written, started)
+    else:
+        for chunk in bulk_io.chunked(rows, chunk_size):
+            written += bulk_io.insert_rows(chunk)
+            db.session.commit()
+            report_progress(written, started)
+    app.logger.info("Generated %d products with seed %d", written, seed)
+
+
+######################################################################
+# Command to partition the product table by category (PostgreSQL)
+# Usage: flask db-partition [--drop-flat]
+######################################################################
+@app.cli.command("db-partition")
+@click.option("--drop-flat", is_flag=True, help="Drop the old flat table after the copy.")
+def db_partition(drop_flat):
+    """
+    Moves the product table into a table list-partitioned by category.
+    """
+    try:
+        if partition_products(db.session, drop_flat):
+            app.logger.info("Product table partitioned by category.")
+        else:
+            app.logger.info("Product table is already partitioned.")
+    except Exception as error:
+        db.session.rollback()
+        raise click.ClickException(f"Error partitioning products: {error}") from error
+
+
+######################################################################
+# Command to archive deleted and long-unavailable products
+# Usage: flask products-archive [--batch-size N] [--unavailable-days N]
+######################################################################
+@app.cli.command("products-archive")
+@click.option("--batch-size", default=lambda: app.config.get("ARCHIVE_BATCH_SIZE", 1000), type=int,
+              help="Rows moved per transaction.")
+@click.option("--unavailable-days", default=lambda: app.config.get("ARCHIVE_UNAVAILABLE_DAYS", 180), type=int,
+              help="Archive products unavailable for longer than this.")
+@click.option("--pause-ms", default=lambda: app.config.get("ARCHIVE_PAUSE_MS", 100), type=int,
+              help="Pause between batches.")
+@click.option("--max-batches", default=None, type=int, help="Stop after this many batches.")
+def products_archive(batch_size, unavailable_days, pause_ms, max_batches):
+    """
+    Moves soft-deleted and long-unavailable products to product_archive.
+    """
+    started = time.monotonic()
+    total = archive_products(
+        batch_size=batch_size,
+        unavailable_days=unavailable_days,
+        pause=pause_ms / 1000.0,
+        max_batches=max_batches,
+        progress=lambda count: report_progress(count, started),
+    )
+    click.echo(f"Archived {total} products", err=True)
+
+
+######################################################################
+# Command to run queued background jobs in a dedicated process
+# Usage: flask jobs-worker [--workers N]
+######################################################################
+@app.cli.command("jobs-worker")
+@click.option("--workers", default=lambda: app.config.get("JOBS_WORKERS", 1), type=int,
+              help="Jobs run at the same time.")
+def jobs_worker(workers):
+    """
+    Claims and runs queued jobs until interrupted.
+    """
+    runner = jobs.make_runner(workers)
+    runner.start()
+    click.echo(f"Running jobs on {workers} threads; Ctrl-C to stop", err=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        click.echo("Stopping after the running jobs finish", err=True)
+        runner.stop()
+        runner.join()
+
+
+######################################################################
+# Command to fingerprint and precompress the admin UI assets
+# Usage: flask assets-build
+######################################################################
+@app.cli.command("assets-build")
+def assets_build():
+    """
+    Writes content-hashed, pre-gzipped static assets to static/dist.
+    """
+    pipeline = AssetPipeline(app.static_folder).build()
+    dist = pipeline.save()
+    app.logger.info("Built %d assets into %s", len(pipeline.assets), dist)
+
+
+######################################################################
+# Commands to stream the catalog in and out of CSV or NDJSON files
+# Usage: flask products-import <file> [--resume]
+#        flask products-export <file>
+######################################################################
+def report_progress(count: int, started: float, rejected: int = 0):
+    """Prints the running row count and throughput"""
+    elapsed = max(time.monotonic() - started, 1e-6)
+    click.echo(
+        f"{count} rows ({rejected} rejected) in {elapsed:.1f}s, {count / elapsed:.0f} rows/s",
+        err=True,
+    )
+
+
+@app.cli.command("products-import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(bulk_io.FORMATS), help="Defaults to the file extension.")
+@click.option("--chunk-size", default=5000, show_default=True, help="Rows per transaction.")
+@click.option("--resume", is_flag=True, help="Skip the records committed by an earlier run.")
+@click.option("--strict", is_flag=True, help="Stop at the first invalid record.")
+def products_import(path, fmt, chunk_size, resume, strict):
+    """
+    Loads Products from a CSV or NDJSON file in bounded-memory chunks.
+    Progress is checkpointed to <file>.checkpoint after every commit.
+    """
+    try:
+        fmt = bulk_io.detect_format(path, fmt)
+    except DataValidationError as error:
+        raise click.UsageError(str(error)) from error
+    checkpoint = path + ".checkpoint"
+    skip = 0
+    if resume and os.path.exists(checkpoint):
+        with open(checkpoint, encoding="utf-8") as file:
+            skip = int(file.read().strip() or 0)
+        click.echo(f"Resuming after {skip} records", err=True)
+
+    started = time.monotonic()
+    consumed, loaded, rejected = skip, 0, 0
+    with open(path, newline="", encoding="utf-8") as file:
+        records = bulk_io.read_records(file, fmt)
+        for _ in range(skip):
+            next(records, None)
+        for chunk in bulk_io.chunked(records, chunk_size):
+            rows, errors = bulk_io.validate_chunk(chunk)
+            for line_no, error in errors.items():
+                if strict:
+                    raise click.ClickException(f"line {line_no}: {error}")
+                click.echo(f"line {line_no}: {error}", err=True)
+            rejected += len(errors)
+            loaded += bulk_io.insert_rows(rows)
+            db.session.commit()
+            consumed += len(chunk)
+            with open(checkpoint, "w", encoding="utf-8") as file:
+                file.write(str(consumed))
+            report_progress(loaded, started, rejected)
+
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    app.logger.info("Imported %d products from %s (%d rejected)", loaded, path, rejected)
+
+
+@app.cli.command("products-export")
+@click.argument("path", type=click.Path(dir_okay=False, writable=True))
+@click.option("--format", "fmt", type=click.Choice(bulk_io.FORMATS), help="Defaults to the file extension.")
+@click.option("--chunk-size", default=10000, show_default=True, help="Rows fetched per round trip.")
+def products_export(path, fmt, chunk_size):
+    """
+    Streams every Product to a CSV or NDJSON file in id order.
+    """
+    try:
+        fmt = bulk_io.detect_format(path, fmt)
+    except DataValidationError as error:
+        raise click.UsageError(str(error)) from error
+    started = time.monotonic()
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        if fmt == "csv" and bulk_io.copy_supported():
+            count = bulk_io.copy_out(file)
+            report_progress(count, started)
+        else:
+            count = 0
+            for chunk in bulk_io.chunked(bulk_io.iter_rows(chunk_size), chunk_size):
+                count += bulk_io.write_records(file, fmt, chunk, header=count == 0)
+                report_progress(count, started)
+    app.logger.info("Exported %d products to %s", count, path)
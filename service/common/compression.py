@@ -0,0 +1,166 @@
+"""
+Response Compression
+
+This module compresses large responses using the best encoding the
+client accepts. Compressed bodies of GET responses are cached by ETag
+so repeated requests for the same payload skip recompression, and a
+request whose If-None-Match still matches gets 304 Not Modified without
+any compression at all.
+
+gzip is always available; brotli and zstd are used when the optional
+``brotli`` or ``zstandard`` packages are installed.
+"""
+import gzip
+import threading
+from collections import OrderedDict
+from flask import request
+from service import app
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "text/html",
+    "text/css",
+    "text/plain",
+)
+
+
+def _gzip(data: bytes, level: int) -> bytes:
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(data: bytes, level: int) -> bytes:
+    return brotli.compress(data, quality=min(level, 11))
+
+
+def _zstd(data: bytes, level: int) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+# Ordered by server preference when the client accepts several equally
+ENCODERS = OrderedDict()
+if brotli:
+    ENCODERS["br"] = _brotli
+if zstandard:
+    ENCODERS["zstd"] = _zstd
+ENCODERS["gzip"] = _gzip
+
+
+class CompressedCache:
+    """A small thread-safe LRU of compressed bodies keyed by (ETag, encoding)"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns a cached body or None"""
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body: bytes):
+        """Stores a body, evicting the least recently used one if full"""
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Removes all cached bodies"""
+        with self._lock:
+            self._entries.clear()
+
+
+cache = CompressedCache(app.config.get("COMPRESSION_CACHE_SIZE", 256))
+
+
+def choose_encoding(accept_encoding: str):
+    """Returns the best supported encoding from an Accept-Encoding header"""
+    preference = list(ENCODERS)
+    best, best_rank = None, None
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if quality <= 0:
+            continue
+        for candidate in preference if coding == "*" else [coding]:
+            if candidate not in ENCODERS:
+                continue
+            rank = (quality, -preference.index(candidate))
+            if best_rank is None or rank > best_rank:
+                best, best_rank = candidate, rank
+    return best
+
+
+######################################################################
+# Compress responses on the way out
+######################################################################
+@app.after_request
+def compress_response(response):
+    """Compresses the response body when it is large enough to pay off"""
+    response.vary.add("Accept-Encoding")
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code != 200
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_TYPES
+    ):
+        return response
+
+    encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < app.config.get("COMPRESSION_MIN_SIZE", 1024):
+        return response
+
+    key = None
+    if request.method == "GET":
+        etag, weak = response.get_etag()
+        if not etag:
+            response.add_etag()
+            etag, weak = response.get_etag()
+        # each representation gets its own validator, and a weak one stays weak
+        response.set_etag(f"{etag}-{encoding}", weak)
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+        key = (etag, encoding)
+        body = cache.get(key)
+        if body is not None:
+            return _encoded(response, body, encoding)
+
+    body = ENCODERS[encoding](data, app.config.get("COMPRESSION_LEVEL", 6))
+    if key:
+        cache.put(key, body)
+    return _encoded(response, body, encoding)
+
+
+def _encoded(response, body: bytes, encoding: str):
+    """Replaces the response body with its encoded form"""
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,99 @@
+"""
+Group Commit
+
+This module batches concurrent inserts from request threads into a
+single database transaction so that a burst of writes pays for one
+commit instead of one commit per row
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger("flask.app")
+
+
+class GroupCommitter:
+    """Queues new model instances and commits them together
+
+    Each caller gets a Future that resolves to the new primary key once the
+    shared commit lands, or to the exception raised by its own row.
+    """
+
+    def __init__(self, app, db, max_batch: int = 64, window_ms: int = 5):
+        self.app = app
+        self.db = db
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, instance) -> Future:
+        """Queues an instance to be inserted by the next group commit"""
+        future = Future()
+        self._queue.put((instance, future))
+        self._start()
+        return future
+
+    def _start(self):
+        """Starts the flusher thread lazily so it is created after a fork"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="group-commit", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        """Collects a batch every window (or max_batch items) and flushes it"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.flush(batch)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error("Group commit failed: %s", error)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+
+    def flush(self, batch: list):
+        """Inserts a batch of instances in a single transaction
+
+        Every row is flushed inside its own savepoint so a bad row only fails
+        its own caller and the rest of the batch is still committed.
+        """
+        with self.app.app_context():
+            with Session(self.db.engine, expire_on_commit=False) as session:
+                pending = []
+                for instance, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with session.begin_nested():
+                            session.add(instance)
+                        pending.append((instance, future))
+                    except Exception as error:  # pylint: disable=broad-except
+                        future.set_exception(error)
+                try:
+                    session.commit()
+                except Exception as error:  # pylint: disable=broad-except
+                    session.rollback()
+                    for _, future in pending:
+                        future.set_exception(error)
+                    return
+                logger.info("Group commit of %d products", len(pending))
+                for instance, future in pending:
+                    session.expunge(instance)
+                    future.set_result(instance.id)
@@ -0,0 +1,189 @@
+"""
+Idempotency Keys
+
+This module makes POST and PUT requests that carry an Idempotency-Key
+header safe to retry. The first request with a key claims it by inserting
+a row into idempotency_key in its own short transaction; when it finishes,
+its status and body are stored on that row. A retry with the same key and
+the same request replays the stored response without running the route
+again, and a retry that arrives while the first request is still running
+waits for it (up to IDEMPOTENCY_WAIT_MS) instead of running alongside it.
+
+Reusing a key for a different request is refused with 422. Server errors
+and streamed responses are not stored: the claim is released so the client
+can simply retry. Streamed uploads skip all of this, since fingerprinting
+them would read their whole body into memory. Keys expire after IDEMPOTENCY_TTL_SECONDS and the table
+is trimmed to IDEMPOTENCY_MAX_KEYS rows as workers claim new keys.
+"""
+import hashlib
+import itertools
+import time
+from datetime import datetime, timedelta
+from flask import abort, g, request
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from service import app
+from service.models import db, IdempotencyKey
+from . import status
+from .batch import is_batched
+
+HEADER = "Idempotency-Key"
+METHODS = ("POST", "PUT")
+MAX_KEY_LENGTH = 255
+# Endpoints that read request.stream themselves
+STREAMING_ENDPOINTS = {"ingest_products"}
+POLL_INTERVAL = 0.05
+
+_claims = itertools.count(1)
+
+
+def fingerprint() -> str:
+    """Hashes what makes a request the same request"""
+    digest = hashlib.sha256()
+    for part in (request.method, request.full_path):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def claim(key: str, request_print: str) -> bool:
+    """Returns True if this request now owns the key"""
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(
+                insert(IdempotencyKey.__table__).values(
+                    key=key, fingerprint=request_print, created_at=datetime.utcnow()
+                )
+            )
+    except IntegrityError:
+        return False
+    if next(_claims) % app.config.get("IDEMPOTENCY_PURGE_EVERY", 100) == 0:
+        purge(app.config.get("IDEMPOTENCY_TTL_SECONDS", 86400),
+              app.config.get("IDEMPOTENCY_MAX_KEYS", 100000))
+    return True
+
+
+def lookup(key: str):
+    """Returns the key's row, or None"""
+    with db.engine.connect() as connection:
+        return connection.execute(
+            select(IdempotencyKey.__table__).where(IdempotencyKey.key == key)
+        ).first()
+
+
+def release(key: str, created_at: datetime = None):
+    """Deletes a claim (only the one created at created_at, if given)"""
+    statement = delete(IdempotencyKey.__table__).where(IdempotencyKey.key == key)
+    if created_at is not None:
+        statement = statement.where(IdempotencyKey.created_at == created_at)
+    with db.engine.begin() as connection:
+        connection.execute(statement)
+
+
+def complete(key: str, response):
+    """Stores the response on the claimed key"""
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(IdempotencyKey.__table__)
+            .where(IdempotencyKey.key == key)
+            .values(
+                status=response.status_code,
+                mimetype=response.mimetype,
+                location=response.headers.get("Location"),
+                body=response.get_data(as_text=True),
+            )
+        )
+
+
+def purge(ttl: int, max_keys: int) -> int:
+    """Deletes expired keys and then the oldest ones beyond max_keys"""
+    table = IdempotencyKey.__table__
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    with db.engine.begin() as connection:
+        oldest_kept = connection.execute(
+            select(table.c.created_at)
+            .order_by(table.c.created_at.desc())
+            .offset(max_keys - 1)
+            .limit(1)
+        ).scalar()
+        if oldest_kept is not None and oldest_kept > cutoff:
+            cutoff = oldest_kept
+        return connection.execute(delete(table).where(table.c.created_at < cutoff)).rowcount
+
+
+def replay(row):
+    """Rebuilds the stored response"""
+    response = app.response_class(row.body, status=row.status, mimetype=row.mimetype)
+    if row.location:
+        response.headers["Location"] = row.location
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+######################################################################
+# Replay retried requests and serialize concurrent ones
+######################################################################
+@app.before_request
+def replay_or_claim():
+    """Claims a new key, or answers a retry from the stored response"""
+    key = request.headers.get(HEADER)
+    if not key or request.method not in METHODS or is_batched() or request.endpoint in STREAMING_ENDPOINTS:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        abort(
+            status.HTTP_400_BAD_REQUEST, f"{HEADER} must be at most {MAX_KEY_LENGTH} characters."
+        )
+    request_print = fingerprint()
+    ttl = timedelta(seconds=app.config.get("IDEMPOTENCY_TTL_SECONDS", 86400))
+    lock_timeout = timedelta(seconds=app.config.get("IDEMPOTENCY_LOCK_TIMEOUT_SECONDS", 60))
+    deadline = time.monotonic() + app.config.get("IDEMPOTENCY_WAIT_MS", 5000) / 1000.0
+    while True:
+        if claim(key, request_print):
+            g.idempotency_key = key
+            return None
+        row = lookup(key)
+        if row is None:
+            continue  # released meanwhile, try to claim it again
+        age = datetime.utcnow() - row.created_at
+        if age > ttl or (row.status is None and age > lock_timeout):
+            release(key, row.created_at)  # expired, or its owner died
+            continue
+        if row.fingerprint != request_print:
+            abort(
+                status.HTTP_422_UNPROCESSABLE_ENTITY,
+                f"{HEADER} '{key}' was already used for a different request.",
+            )
+        if row.status is not None:
+            return replay(row)
+        if time.monotonic() > deadline:
+            abort(
+                status.HTTP_409_CONFLICT,
+                f"A request with {HEADER} '{key}' is still in progress.",
+            )
+        time.sleep(POLL_INTERVAL)
+
+
+@app.after_request
+def store_response(response):
+    """Stores the outcome for retries, or frees the key if it should be retried"""
+    if is_batched():
+        return response
+    key = g.pop("idempotency_key", None)
+    if key is None:
+        return response
+    if response.status_code >= 500 or response.is_streamed or response.direct_passthrough:
+        release(key)
+    else:
+        complete(key, response)
+    return response
+
+
+@app.teardown_request
+def release_unfinished(_error=None):
+    """Frees a key whose request ended without a response to store"""
+    if is_batched():
+        return
+    key = g.pop("idempotency_key", None)
+    if key is not None:
+        release(key)
@@ -0,0 +1,402 @@
+"""
+Background Jobs
+
+This module runs long catalog maintenance (archival, reindexing,
+recomputing the catalog aggregates) outside of request handlers. POST
+/jobs only queues a row in the job table; a JobRunner claims queued jobs
+and runs them on its own threads, recording progress, a heartbeat and
+finally the result or the error on the row, where GET /jobs/<id> reads it.
+
+Runners start lazily in a web worker the first time it serves a job
+route (when JOBS_ENABLED is set), or as a dedicated process with
+``flask jobs-worker``. Jobs are claimed with a conditional UPDATE, so any
+number of runners in any number of processes can share the table, and a
+running job whose heartbeat is older than JOBS_STALE_SECONDS (its runner
+died) is queued again.
+
+Cancelling a queued job takes effect at once. A running job is asked to
+stop: the flag is seen the next time the job reports progress, which the
+built-in jobs do between batches, so they stop at a consistent point.
+"""
+import os
+import socket
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import case, func, select, text, update
+from service import app
+from service.models import db, DataValidationError, Job, Product, ProductArchive
+from .archival import archive_products
+
+JobKind = namedtuple("JobKind", "func params")
+
+# kind -> JobKind(function, {parameter: type})
+JOB_KINDS = {}
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it has been asked to stop"""
+
+
+def job_kind(name: str, **params):
+    """Registers a function as a job kind taking the given typed parameters"""
+
+    def register(func):
+        JOB_KINDS[name] = JobKind(func, params)
+        return func
+
+    return register
+
+
+def validate(data) -> tuple:
+    """Returns the (kind, params) of a POST /jobs body"""
+    if not isinstance(data, dict) or data.get("kind") not in JOB_KINDS:
+        raise DataValidationError(f"Invalid job: kind must be one of {', '.join(sorted(JOB_KINDS))}")
+    kind, params = data["kind"], data.get("params") or {}
+    if not isinstance(params, dict):
+        raise DataValidationError("Invalid job: params must be an object")
+    accepted = JOB_KINDS[kind].params
+    for name, value in params.items():
+        if name not in accepted:
+            raise DataValidationError(f"Invalid job: {kind} takes no parameter '{name}'")
+        if isinstance(value, bool) or not isinstance(value, accepted[name]):
+            raise DataValidationError(
+                f"Invalid job: {name} must be of type {accepted[name].__name__}"
+            )
+    return kind, params
+
+
+def submit(kind: str, params: dict) -> Job:
+    """Queues a job and wakes this worker's runner, if it has one"""
+    job = Job(kind=kind, params=params, status="queued")
+    db.session.add(job)
+    db.session.commit()
+    if _runner is not None:
+        _runner.wake()
+    return job
+
+
+def cancel(job_id: int) -> str:
+    """Cancels a queued job or asks a running one to stop
+
+    :return: "cancelled", "cancelling", or None if the job is not queued or running
+    :rtype: str
+
+    """
+    table = Job.__table__
+    with db.engine.begin() as connection:
+        if connection.execute(
+            update(table)
+            .where(table.c.id == job_id, table.c.status == "queued")
+            .values(status="cancelled", finished_at=datetime.utcnow())
+        ).rowcount:
+            return "cancelled"
+        if connection.execute(
+            update(table)
+            .where(table.c.id == job_id, table.c.status == "running")
+            .values(cancel_requested=True)
+        ).rowcount:
+            return "cancelling"
+    return None
+
+
+######################################################################
+# Claiming and recording jobs
+######################################################################
+def requeue_stale(stale_seconds: float) -> int:
+    """Queues again the running jobs whose runner stopped heart-beating"""
+    table = Job.__table__
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_seconds)
+    with db.engine.begin() as connection:
+        return connection.execute(
+            update(table)
+            .where(table.c.status == "running", table.c.heartbeat_at < cutoff)
+            .values(status="queued", worker=None)
+        ).rowcount
+
+
+def claim_next(worker: str) -> tuple:
+    """Claims the oldest queued job for worker
+
+    :return: (job id, kind, params), or None when nothing is queued
+    :rtype: tuple
+
+    """
+    table = Job.__table__
+    with db.engine.begin() as connection:
+        candidates = connection.execute(
+            select(table.c.id, table.c.kind, table.c.params)
+            .where(table.c.status == "queued")
+            .order_by(table.c.id)
+            .limit(5)
+        ).all()
+        for job_id, kind, params in candidates:
+            now = datetime.utcnow()
+            claimed = connection.execute(
+                update(table)
+                .where(table.c.id == job_id, table.c.status == "queued")
+                .values(status="running", worker=worker, started_at=now, heartbeat_at=now)
+            ).rowcount
+            if claimed:
+                return job_id, kind, params
+    return None
+
+
+def finish(job_id: int, worker: str, status: str, result=None, error: str = None):
+    """Records the outcome, unless the job was taken over by another runner"""
+    table = Job.__table__
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(table)
+            .where(table.c.id == job_id, table.c.worker == worker)
+            .values(status=status, result=result, error=error, finished_at=datetime.utcnow())
+        )
+
+
+def heartbeat(job_ids: list):
+    """Tells other runners these jobs are still alive"""
+    if not job_ids:
+        return
+    table = Job.__table__
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(table).where(table.c.id.in_(job_ids)).values(heartbeat_at=datetime.utcnow())
+        )
+
+
+class JobContext:
+    """What a running job uses to report progress and notice cancellation"""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+
+    def progress(self, count: int):
+        """Records how far the job got; raises JobCancelled if asked to stop"""
+        table = Job.__table__
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(table)
+                .where(table.c.id == self.job_id)
+                .values(progress=count, heartbeat_at=datetime.utcnow())
+            )
+            cancelled = connection.execute(
+                select(table.c.cancel_requested).where(table.c.id == self.job_id)
+            ).scalar()
+        if cancelled:
+            raise JobCancelled()
+
+
+def run_job(job_id: int, kind: str, params: dict, worker: str) -> str:
+    """Runs one claimed job to completion and records how it ended
+
+    The job gets an app context, and so a session, of its own; the caller's
+    session is left untouched and the job's is removed when it ends.
+    """
+    app.logger.info("Running job %s (%s)", job_id, kind)
+    with app.app_context():
+        try:
+            result = JOB_KINDS[kind].func(JobContext(job_id), **params)
+        except JobCancelled:
+            db.session.rollback()
+            finish(job_id, worker, "cancelled")
+            return "cancelled"
+        except Exception as error:  # pylint: disable=broad-except
+            db.session.rollback()
+            app.logger.error("Job %s (%s) failed: %s", job_id, kind, error)
+            finish(job_id, worker, "failed", error=str(error) or error.__class__.__name__)
+            return "failed"
+    finish(job_id, worker, "succeeded", result=result)
+    return "succeeded"
+
+
+def run_next(worker: str = None) -> str:
+    """Claims and runs the oldest queued job, returning how it ended or None"""
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    claimed = claim_next(worker)
+    if claimed is None:
+        return None
+    return run_job(*claimed, worker)
+
+
+class JobRunner:
+    """Claims and runs queued jobs on a pool of background threads"""
+
+    def __init__(self, workers: int, poll: float, stale: float):
+        self.workers = workers
+        self.poll = poll
+        self.stale = stale
+        self.running = {}  # thread name -> job id
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Starts the job threads and the heartbeat"""
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"jobs-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._beat, name="jobs-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        """Asks the threads to finish once their current job is done"""
+        self._stop.set()
+        self._wake.set()
+
+    def join(self, timeout: float = None):
+        """Waits for the threads to finish"""
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def wake(self):
+        """Makes an idle thread look for work now instead of at its next poll"""
+        self._wake.set()
+
+    def _work(self):
+        name = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        while not self._stop.is_set():
+            with app.app_context():
+                try:
+                    claimed = claim_next(name)
+                    if claimed is not None:
+                        self.running[name] = claimed[0]
+                        try:
+                            run_job(*claimed, name)
+                        finally:
+                            self.running.pop(name, None)
+                        continue
+                except Exception as error:  # pylint: disable=broad-except
+                    app.logger.error("Job runner failed: %s", error)
+            self._wake.wait(self.poll)
+            self._wake.clear()
+
+    def _beat(self):
+        interval = max(self.stale / 3, 0.01)
+        while not self._stop.wait(interval):
+            with app.app_context():
+                try:
+                    heartbeat(list(self.running.values()))
+                    requeue_stale(self.stale)
+                except Exception as error:  # pylint: disable=broad-except
+                    app.logger.error("Job heartbeat failed: %s", error)
+
+
+def make_runner(workers: int = None) -> JobRunner:
+    """Builds a JobRunner from the JOBS_* settings"""
+    return JobRunner(
+        workers or app.config.get("JOBS_WORKERS", 1),
+        app.config.get("JOBS_POLL_MS", 1000) / 1000.0,
+        app.config.get("JOBS_STALE_SECONDS", 300),
+    )
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner() -> JobRunner:
+    """Returns the worker's job runner, starting it on first use (after the fork)"""
+    global _runner  # pylint: disable=global-statement
+    if _runner is None and app.config.get("JOBS_ENABLED"):
+        with _runner_lock:
+            if _runner is None:
+                runner = make_runner()
+                runner.start()
+                _runner = runner
+    return _runner
+
+
+######################################################################
+# Built-in job kinds
+######################################################################
+@job_kind("archive", batch_size=int, unavailable_days=int, pause_ms=int)
+def archive_job(context, batch_size=None, unavailable_days=None, pause_ms=None) -> dict:
+    """Archives deleted and long-unavailable products batch by batch"""
+    total = archive_products(
+        batch_size=batch_size or app.config.get("ARCHIVE_BATCH_SIZE", 1000),
+        unavailable_days=unavailable_days or app.config.get("ARCHIVE_UNAVAILABLE_DAYS", 180),
+        pause=(pause_ms if pause_ms is not None else app.config.get("ARCHIVE_PAUSE_MS", 100)) / 1000.0,
+        progress=context.progress,
+    )
+    return {"archived": total}
+
+
+def reindex_targets(connection, table: str) -> list:
+    """Returns the partitions of a partitioned table, or just the table"""
+    partitions = connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "WHERE parent.relname = :name ORDER BY child.relname"
+        ),
+        {"name": table},
+    ).scalars().all()
+    return partitions or [table]
+
+
+@job_kind("reindex")
+def reindex_job(context) -> dict:
+    """Rebuilds the catalog tables' indexes and refreshes planner statistics
+
+    On PostgreSQL each table, or each partition of a partitioned one, is
+    rebuilt with REINDEX CONCURRENTLY, so reads and writes carry on while
+    it runs, and progress is reported after every one of them.
+    """
+    tables = [Product.__tablename__, ProductArchive.__tablename__]
+    if db.engine.dialect.name != "postgresql":
+        for done, table in enumerate(tables, 1):
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(f"REINDEX {table}")
+                connection.exec_driver_sql(f"ANALYZE {table}")
+            context.progress(done)
+        return {"tables": tables}
+    done = 0
+    # REINDEX CONCURRENTLY cannot run inside a transaction block
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        # waiting behind a long transaction would hold the job, not other queries
+        timeout = int(app.config.get("JOBS_LOCK_TIMEOUT_MS", 5000))
+        connection.exec_driver_sql(f"SET lock_timeout = {timeout}")
+        try:
+            for table in tables:
+                for target in reindex_targets(connection, table):
+                    connection.exec_driver_sql(f"REINDEX TABLE CONCURRENTLY {target}")
+                    connection.exec_driver_sql(f"ANALYZE {target}")
+                    done += 1
+                    context.progress(done)
+                if target != table:
+                    connection.exec_driver_sql(f"ANALYZE {table}")  # the parent's own statistics
+        finally:
+            connection.exec_driver_sql("RESET lock_timeout")
+    return {"tables": tables, "reindexed": done}
+
+
+@job_kind("catalog-stats")
+def catalog_stats_job(context) -> dict:
+    """Recomputes the per-category product counts and prices"""
+    rows = db.session.execute(
+        select(
+            Product.category,
+            func.count(Product.id),
+            func.sum(case((Product.available.is_(True), 1), else_=0)),
+            func.min(Product.price),
+            func.max(Product.price),
+            func.avg(Product.price),
+        )
+        .where(Product.deleted_at.is_(None))
+        .group_by(Product.category)
+    ).all()
+    categories = {}
+    for category, count, available, lowest, highest, average in rows:
+        categories[category.name] = {
+            "products": count,
+            "available": int(available or 0),
+            "min_price": str(lowest),
+            "max_price": str(highest),
+            "average_price": str(Decimal(str(average)).quantize(Decimal("0.01"))),
+        }
+    context.progress(len(rows))
+    return {"products": sum(stats["products"] for stats in categories.values()), "categories": categories}
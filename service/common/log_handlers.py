@@ -1,23 +1,110 @@
-
-
 """
 Log Handlers
 
 This module contains utility functions to set up logging
 consistently
 """
+import atexit
+import json
 import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a fraction of the INFO/DEBUG records of selected loggers
+
+    Rates are keyed by logger name and apply to that logger and its children;
+    warnings and errors are never dropped.
+    """
+
+    def __init__(self, rates: dict = None):
+        super().__init__()
+        # longest names first so the most specific rate wins
+        self.rates = sorted((rates or {}).items(), key=lambda item: -len(item[0]))
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        for name, rate in self.rates:
+            if record.name == name or record.name.startswith(name + "."):
+                return random.random() < rate
+        return True
+
+
+class TruncatingFilter(logging.Filter):
+    """Cuts long messages (such as request payloads) down to max_length"""
+
+    def __init__(self, max_length: int = 512):
+        super().__init__()
+        self.max_length = max_length
+
+    def filter(self, record):
+        message = record.getMessage()
+        if len(message) > self.max_length:
+            record.msg = f"{message[:self.max_length]}... [{len(message)} chars]"
+            record.args = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%d %H:%M:%S %z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
 
 
 def init_logging(app, logger_name: str):
-    """Set up logging for production"""
+    """Set up logging for production
+
+    Records are put on an in-memory queue and written by a background
+    QueueListener, so request threads never block on log I/O. Loggers
+    named in LOG_SAMPLE_RATES are routed through the same queue, so their
+    rates apply to them as well as to the app logger.
+    """
     app.logger.propagate = False
     gunicorn_logger = logging.getLogger(logger_name)
-    app.logger.handlers = gunicorn_logger.handlers
+    handlers = list(gunicorn_logger.handlers)
     app.logger.setLevel(gunicorn_logger.level)
     # Make all log formats consistent
-    format_string = "[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s"
-    formatter = logging.Formatter(format_string, "%Y-%m-%d %H:%M:%S %z")
-    for handler in app.logger.handlers:
+    if app.config.get("LOG_FORMAT") == "json":
+        formatter = JsonFormatter()
+    else:
+        format_string = "[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s"
+        formatter = logging.Formatter(format_string, "%Y-%m-%d %H:%M:%S %z")
+    for handler in handlers:
         handler.setFormatter(formatter)
-    app.logger.info("Logging handler established")
\ No newline at end of file
+    # Sampling and truncation run before the record is queued
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(app.config.get("LOG_SAMPLE_RATES")))
+    queue_handler.addFilter(TruncatingFilter(app.config.get("LOG_MAX_PAYLOAD", 512)))
+    app.logger.handlers = [queue_handler]
+    # other sampled loggers (e.g. sqlalchemy.engine) must pass the same filters
+    for name in app.config.get("LOG_SAMPLE_RATES") or {}:
+        if name and name != app.logger.name and not name.startswith(app.logger.name + "."):
+            logger = logging.getLogger(name)
+            logger.handlers = [queue_handler]
+            logger.propagate = False
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    app.extensions["log_listener"] = listener
+    atexit.register(stop_logging, app)
+    app.logger.info("Logging handler established")
+
+
+def stop_logging(app):
+    """Flushes the log queue and stops the background listener"""
+    listener = app.extensions.pop("log_listener", None)
+    if listener:
+        listener.stop()
@@ -0,0 +1,91 @@
+"""
+Schema Migrations
+
+create_all() only creates missing tables; it never alters one that
+already exists. A product table created before soft deletes, change
+tracking and creation times were added is missing last_modified,
+deleted_at and created_at, and the partial indexes that go with them.
+
+This module adds those columns in place, fills them in for the rows that
+were already there and creates the missing indexes. Every statement is
+idempotent, so ``flask db-migrate`` can be run again on a table that is
+partly or fully migrated (or partitioned) and only does what is left.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+from service.models import Product
+
+# column -> SQL type, on a table created from the original schema
+ADDED_COLUMNS = {
+    "last_modified": "TIMESTAMP",
+    "deleted_at": "TIMESTAMP",
+    "created_at": "TIMESTAMP",
+}
+
+
+def _postgresql_statements(name: str) -> list:
+    """Returns the migration for Postgres, which can skip existing columns itself"""
+    statements = [
+        f"ALTER TABLE {name} ADD COLUMN IF NOT EXISTS {column} {sql_type}"
+        for column, sql_type in ADDED_COLUMNS.items()
+    ]
+    statements += [
+        f"UPDATE {name} SET last_modified = timezone('utc', now()) WHERE last_modified IS NULL",
+        f"UPDATE {name} SET created_at = last_modified WHERE created_at IS NULL",
+        f"ALTER TABLE {name} ALTER COLUMN created_at SET DEFAULT now()",
+        f"ALTER TABLE {name} ALTER COLUMN last_modified SET NOT NULL",
+        f"ALTER TABLE {name} ALTER COLUMN created_at SET NOT NULL",
+    ]
+    return statements
+
+
+def _sqlite_statements(name: str, missing: set) -> list:
+    """Returns the migration for SQLite, which can only append nullable columns
+
+    SQLite cannot give an added column a CURRENT_TIMESTAMP default, so a
+    trigger stamps created_at on the rows inserted without one.
+    """
+    statements = [
+        f"ALTER TABLE {name} ADD COLUMN {column} {sql_type}"
+        for column, sql_type in ADDED_COLUMNS.items()
+        if column in missing
+    ]
+    statements += [
+        f"UPDATE {name} SET last_modified = CURRENT_TIMESTAMP WHERE last_modified IS NULL",
+        f"UPDATE {name} SET created_at = last_modified WHERE created_at IS NULL",
+    ]
+    if "created_at" in missing:
+        statements.append(
+            f"CREATE TRIGGER IF NOT EXISTS {name}_created_at AFTER INSERT ON {name} "
+            f"WHEN NEW.created_at IS NULL BEGIN "
+            f"UPDATE {name} SET created_at = CURRENT_TIMESTAMP WHERE id = NEW.id; END"
+        )
+    return statements
+
+
+def migration_statements(connection) -> list:
+    """Returns the DDL and backfill that bring the product table up to date"""
+    table = Product.__table__
+    if connection.dialect.name == "postgresql":
+        statements = _postgresql_statements(table.name)
+    else:
+        existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+        statements = _sqlite_statements(table.name, set(ADDED_COLUMNS) - existing)
+    for index in table.indexes:
+        statements.append(str(CreateIndex(index, if_not_exists=True).compile(dialect=connection.dialect)))
+    return statements
+
+
+def migrate_products(session) -> int:
+    """Migrates the product table in one transaction
+
+    :return: the number of statements that were run
+    :rtype: int
+
+    """
+    connection = session.connection()
+    statements = migration_statements(connection)
+    for statement in statements:
+        connection.execute(text(statement))
+    session.commit()
+    return len(statements)
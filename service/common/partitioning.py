@@ -0,0 +1,90 @@
+"""
+Category Partitioning
+
+This module converts the product table into a Postgres table that is
+list-partitioned by category, with one partition per Category value.
+Queries that filter on category (find_by_category, or the other finders
+when given a category) are then pruned to a single partition, and vacuum
+or reindex can work on one partition at a time.
+
+The ORM mapping does not change: the partitioned table keeps the same
+name, columns and id sequence, but its primary key becomes (id, category)
+because Postgres requires the partition key in every unique constraint.
+"""
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+from service.models import Product, Category
+
+FLAT_SUFFIX = "_flat"
+
+
+def partition_name(category: Category) -> str:
+    """Returns the name of the partition that holds a category"""
+    return f"{Product.__table__.name}_{category.name.lower()}"
+
+
+def is_partitioned(connection) -> bool:
+    """Returns True if the product table is already partitioned"""
+    return connection.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :name)"
+        ),
+        {"name": Product.__table__.name},
+    ).scalar()
+
+
+def migration_statements(drop_flat: bool = False) -> list:
+    """Returns the DDL that moves the flat table into a partitioned one
+
+    The flat table is renamed out of the way, the partitioned table is
+    created in its place with every index declared on the model, the rows
+    are copied across and the id sequence changes owner. The flat table
+    is kept (as product_flat) unless drop_flat is True.
+    """
+    table = Product.__table__
+    name, flat = table.name, table.name + FLAT_SUFFIX
+    statements = [
+        f"LOCK TABLE {name} IN ACCESS EXCLUSIVE MODE",
+        f"ALTER TABLE {name} RENAME TO {flat}",
+        f"ALTER TABLE {flat} RENAME CONSTRAINT {name}_pkey TO {flat}_pkey",
+    ]
+    for index in table.indexes:
+        statements.append(f"ALTER INDEX IF EXISTS {index.name} RENAME TO {index.name}{FLAT_SUFFIX}")
+    statements += [
+        f"CREATE TABLE {name} (LIKE {flat} INCLUDING DEFAULTS) PARTITION BY LIST (category)",
+        f"ALTER TABLE {name} ADD CONSTRAINT {name}_pkey PRIMARY KEY (id, category)",
+    ]
+    for category in Category:
+        statements.append(
+            f"CREATE TABLE {partition_name(category)} PARTITION OF {name} "
+            f"FOR VALUES IN ('{category.name}')"
+        )
+    for index in table.indexes:
+        statements.append(str(CreateIndex(index).compile(dialect=postgresql.dialect())))
+    statements += [
+        f"INSERT INTO {name} SELECT * FROM {flat}",
+        f"ALTER SEQUENCE {name}_id_seq OWNED BY {name}.id",
+    ]
+    if drop_flat:
+        statements.append(f"DROP TABLE {flat}")
+    return statements
+
+
+def partition_products(session, drop_flat: bool = False) -> bool:
+    """Partitions the product table in one transaction
+
+    :return: False if the table was already partitioned
+    :rtype: bool
+
+    """
+    connection = session.connection()
+    if connection.dialect.name != "postgresql":
+        raise RuntimeError("Partitioning requires PostgreSQL")
+    if is_partitioned(connection):
+        return False
+    for statement in migration_statements(drop_flat):
+        connection.execute(text(statement))
+    session.commit()
+    return True
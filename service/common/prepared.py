@@ -0,0 +1,59 @@
+"""
+Prepared Statements
+
+psycopg2 sends every statement as plain text, so PostgreSQL parses and
+plans the hot Product lookups again on every call. This module PREPAREs
+them once per database connection and runs them with EXECUTE, letting the
+server reuse the parse tree and, after a few executions, a generic plan.
+
+Statements are prepared lazily on whichever pooled connection runs them
+first; the pool's per-connection info dict remembers which ones exist, and
+is cleared when a connection is replaced. The statements name the
+model's columns in the model's order, so the rows keep their shape when
+the table gains a column or was created with its columns in another
+order. DB_PREPARED_STATEMENTS is off by default; leave it off behind a
+transaction-pooling proxy such as PgBouncer, which does not keep
+prepared statements on a client's connection.
+"""
+from sqlalchemy import select, text
+
+# name -> the condition (besides not being deleted) on the one parameter $1
+STATEMENTS = {
+    "product_by_id": "id = $1",
+    "products_by_name": "name = $1",
+    "products_by_category": "category = $1",
+    "products_by_availability": "available = $1",
+    "products_by_price": "price = $1",
+}
+
+
+def supported(db, app) -> bool:
+    """Returns True if the hot lookups should use prepared statements"""
+    return bool(app.config.get("DB_PREPARED_STATEMENTS")) and db.engine.dialect.name == "postgresql"
+
+
+def prepare(connection, model, name: str):
+    """PREPAREs a statement on the connection unless it already has it"""
+    info = connection.connection.info.setdefault("prepared_statements", set())
+    if name not in info:
+        table = model.__table__
+        columns = ", ".join(column.name for column in table.columns)
+        connection.exec_driver_sql(
+            f"PREPARE {name} AS SELECT {columns} FROM {table.name} "
+            f"WHERE deleted_at IS NULL AND {STATEMENTS[name]}"
+        )
+        info.add(name)
+
+
+def execute(session, model, name: str, value) -> list:
+    """Runs a prepared lookup and returns the model instances it matched"""
+    prepare(session.connection(), model, name)
+    statement = select(model).from_statement(text(f"EXECUTE {name}(:value)"))
+    return session.execute(statement, {"value": value}).scalars().all()
+
+
+def execute_rows(session, model, name: str, value) -> list:
+    """Runs a prepared lookup and returns its rows, without building model instances"""
+    prepare(session.connection(), model, name)
+    statement = text(f"EXECUTE {name}(:value)").columns(*model.__table__.columns)
+    return session.execute(statement, {"value": value}).all()
@@ -0,0 +1,158 @@
+"""
+Sampling Profiler
+
+This module samples the stacks of the worker's request threads so a busy
+pod can be profiled without attaching anything to it. A before_request
+hook notes which Flask endpoint each thread is serving; while a profile
+runs, the profiling request reads sys._current_frames() every
+PROFILER_INTERVAL_MS and counts each other request thread's stack under
+its endpoint. Nothing is recorded between profiles beyond that one dict write
+per request.
+
+The result is a set of collapsed stacks (one "endpoint;frame;frame count"
+line per distinct stack, the input flamegraph.pl and speedscope expect)
+and a summary of the functions with the most self and total samples.
+Only request threads are sampled, so the worker has to run more than one
+thread (e.g. gunicorn --threads) for the profile to see other requests.
+"""
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from flask import abort, request
+from service import app
+from . import status
+
+MAX_DEPTH = 64
+
+# Remembers the endpoint a batch operation's thread served before it
+PREVIOUS_KEY = "service.profiler.previous"
+
+# thread id -> endpoint of the request it is serving
+_active = {}
+_profile_lock = threading.Lock()
+
+
+def frame_label(frame) -> str:
+    """Names a frame as module:function"""
+    code = frame.f_code
+    module = frame.f_globals.get("__name__") or os.path.basename(code.co_filename)
+    return f"{module}:{code.co_name}"
+
+
+def stack_of(frame) -> tuple:
+    """Returns the labels of a stack from the outermost frame inwards"""
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels)
+
+
+class Profile:
+    """Collapsed stack counts gathered by one profiling run"""
+
+    def __init__(self):
+        self.stacks = Counter()
+        self.samples = 0
+        self.seconds = 0.0
+
+    def sample(self, skip: set):
+        """Counts the current stack of every thread serving a request"""
+        frames = sys._current_frames()  # pylint: disable=protected-access
+        for thread_id, endpoint in list(_active.items()):
+            frame = frames.get(thread_id)
+            if frame is None or thread_id in skip:
+                continue
+            self.stacks[(endpoint or "<unknown>",) + stack_of(frame)] += 1
+        self.samples += 1
+
+    def run(self, seconds: float, interval: float):
+        """Samples for seconds, on this thread, every interval seconds"""
+        skip = {threading.get_ident()}
+        started = time.monotonic()
+        deadline = started + seconds
+        while time.monotonic() < deadline:
+            self.sample(skip)
+            time.sleep(interval)
+        self.seconds = time.monotonic() - started
+
+    def collapsed(self) -> list:
+        """Returns flamegraph input lines, heaviest stacks first"""
+        return [f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()]
+
+    def endpoints(self) -> dict:
+        """Returns the number of samples seen per endpoint"""
+        totals = Counter()
+        for stack, count in self.stacks.items():
+            totals[stack[0]] += count
+        return dict(totals.most_common())
+
+    def top(self, limit: int = 20) -> list:
+        """Returns the functions with the most samples on top of the stack"""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack[1:]):
+                total[label] += count
+        return [
+            {"function": label, "self": own[label], "total": total[label]}
+            for label, _ in own.most_common(limit)
+        ]
+
+    def summary(self) -> dict:
+        """Returns the profile as a JSON-ready dictionary"""
+        return {
+            "seconds": round(self.seconds, 3),
+            "samples": self.samples,
+            "endpoints": self.endpoints(),
+            "top": self.top(),
+            "collapsed": self.collapsed(),
+        }
+
+
+def profile(seconds: float, interval: float) -> Profile:
+    """Runs one profile, or returns None if another one is running"""
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        result = Profile()
+        result.run(seconds, interval)
+        return result
+    finally:
+        _profile_lock.release()
+
+
+def check_access():
+    """Aborts unless profiling is enabled and the request carries the token"""
+    if not app.config.get("PROFILER_ENABLED"):
+        abort(status.HTTP_404_NOT_FOUND, "Profiling is not enabled.")
+    token = app.config.get("PROFILER_TOKEN")
+    offered = request.headers.get("X-Profiler-Token", "")
+    if token and not hmac.compare_digest(offered.encode(), token.encode()):
+        abort(status.HTTP_403_FORBIDDEN, "A valid X-Profiler-Token is required.")
+
+
+######################################################################
+# Remember which endpoint every request thread is serving
+######################################################################
+@app.before_request
+def track_endpoint():
+    """Attributes the thread's samples to the endpoint it serves"""
+    thread_id = threading.get_ident()
+    request.environ[PREVIOUS_KEY] = _active.get(thread_id)
+    _active[thread_id] = request.endpoint
+
+
+@app.teardown_request
+def untrack_endpoint(_error=None):
+    """Hands the thread back to the request it served before, if any"""
+    thread_id = threading.get_ident()
+    previous = request.environ.get(PREVIOUS_KEY)
+    if previous is None:
+        _active.pop(thread_id, None)
+    else:
+        _active[thread_id] = previous  # a batch operation ran on the batch's thread
@@ -0,0 +1,91 @@
+"""
+Query Benchmark
+
+Times the hot Product lookups in up to three ways so the cost of building
+and compiling statements can be compared on a real database:
+
+    query     a Query rebuilt (and its cache key recomputed) on every call
+    lambda    Product.search(), the cached lambda statement that also backs
+              the find_by_* methods
+    get       Product.find() without prepared statements, i.e. Session.get,
+              whose statement SQLAlchemy caches on its own
+    prepared  Product.search() / find() running a PREPAREd statement
+              (PostgreSQL only)
+
+The session is emptied before each call so every lookup goes to the
+database rather than the identity map.
+"""
+import time
+from types import SimpleNamespace
+from service import app
+from service.models import db, Product
+
+
+def lookups(sample: SimpleNamespace) -> dict:
+    """Returns {lookup: {way: callable}} for one sample Product"""
+    return {
+        "find": {
+            "query": lambda: Product.live().filter(Product.id == sample.id).first(),
+            "get": lambda: Product.find(sample.id),
+            "prepared": lambda: Product.find(sample.id),
+        },
+        "find_by_name": {
+            "query": lambda: Product.live().filter(Product.name == sample.name).all(),
+            "lambda": lambda: Product.search(name=sample.name),
+            "prepared": lambda: Product.search(name=sample.name),
+        },
+        "find_by_category": {
+            "query": lambda: Product.live().filter(Product.category == sample.category).limit(20).all(),
+            "lambda": lambda: Product.search(category=sample.category, limit=20),
+            "prepared": None,
+        },
+        "find_by_availability": {
+            "query": lambda: Product.live().filter(Product.available == sample.available).limit(20).all(),
+            "lambda": lambda: Product.search(available=sample.available, limit=20),
+            "prepared": None,
+        },
+        "find_by_price": {
+            "query": lambda: Product.live().filter(Product.price == sample.price).all(),
+            "lambda": lambda: Product.search(price=sample.price),
+            "prepared": lambda: Product.search(price=sample.price),
+        },
+    }
+
+
+def time_calls(func, iterations: int) -> float:
+    """Returns the mean microseconds per call of func"""
+    func()  # warm the statement caches
+    started = time.perf_counter()
+    for _ in range(iterations):
+        db.session.expunge_all()
+        func()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def run_benchmark(iterations: int = 1000) -> list:
+    """Returns (lookup, way, microseconds per call) rows
+
+    Lookups that would use a prepared statement are timed with and without
+    DB_PREPARED_STATEMENTS; the lambda and get ways always run without it.
+    """
+    product = Product.live().order_by(Product.id).first()
+    if product is None:
+        return []
+    sample = SimpleNamespace(
+        id=product.id, name=product.name, price=product.price,
+        available=product.available, category=product.category,
+    )
+    can_prepare = db.engine.dialect.name == "postgresql"
+    setting = app.config.get("DB_PREPARED_STATEMENTS")
+    results = []
+    try:
+        for lookup, ways in lookups(sample).items():
+            for way, func in ways.items():
+                if func is None or (way == "prepared" and not can_prepare):
+                    continue
+                app.config["DB_PREPARED_STATEMENTS"] = way == "prepared"
+                results.append((lookup, way, time_calls(func, iterations)))
+    finally:
+        app.config["DB_PREPARED_STATEMENTS"] = setting
+        db.session.rollback()
+    return results
@@ -0,0 +1,171 @@
+"""
+Readiness Checks
+
+This module decides whether a worker should receive traffic. A background
+thread times a SELECT 1 round trip and samples the SQLAlchemy pool every
+READY_CHECK_INTERVAL_MS, and an after_request hook counts server errors in
+a sliding window. GET /ready only reads the cached result, so probes never
+add load to the database.
+
+The worker is not ready when the database cannot be reached, its latency,
+pool utilization or error rate is past the READY_MAX_* thresholds, or the
+checker itself has stopped reporting.
+"""
+import threading
+import time
+from collections import deque
+from flask import request
+from sqlalchemy import text
+from service import app
+from service.models import db
+from .batch import is_batched
+
+# Probes are not traffic; a not-ready 503 must not feed the error rate
+PROBE_ENDPOINTS = {"healthcheck", "readiness_check"}
+
+
+class ErrorRate:
+    """Counts responses and server errors over the last window seconds
+
+    Counts are kept in one bucket per second, so memory stays bounded by
+    the window however busy the worker is.
+    """
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self._buckets = deque()  # [second, responses, errors]
+        self._lock = threading.Lock()
+
+    def record(self, failed: bool):
+        """Adds one response"""
+        second = int(time.monotonic())
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append([second, 0, 0])
+                self._expire(second)
+            bucket = self._buckets[-1]
+            bucket[1] += 1
+            bucket[2] += failed
+
+    def rate(self) -> tuple:
+        """Returns (error rate, number of responses) within the window"""
+        with self._lock:
+            self._expire(int(time.monotonic()))
+            total = sum(bucket[1] for bucket in self._buckets)
+            failures = sum(bucket[2] for bucket in self._buckets)
+        return (failures / total if total else 0.0), total
+
+    def _expire(self, second: int):
+        while self._buckets and self._buckets[0][0] <= second - self.window:
+            self._buckets.popleft()
+
+
+def pool_utilization(pool) -> float:
+    """Returns the share of the pool's connections in use, None if unbounded"""
+    try:
+        capacity = pool.size() + max(pool._max_overflow, 0)  # pylint: disable=protected-access
+        return pool.checkedout() / capacity if capacity > 0 else None
+    except AttributeError:  # NullPool, StaticPool and friends have no limit
+        return None
+
+
+class ReadinessChecker:
+    """Measures the database on a background thread and caches the verdict"""
+
+    def __init__(self, interval: float, errors: ErrorRate):
+        self.interval = interval
+        self.errors = errors
+        self.result = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Runs one check now and then keeps checking in the background"""
+        self.check()
+        self._thread = threading.Thread(target=self._run, name="readiness", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Asks the background thread to finish"""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def check(self) -> dict:
+        """Measures the database and the pool and caches the result"""
+        with app.app_context():
+            utilization = pool_utilization(db.engine.pool)
+            started = time.monotonic()
+            try:
+                with db.engine.connect() as connection:
+                    connection.execute(text("SELECT 1"))
+                latency, error = (time.monotonic() - started) * 1000, None
+            except Exception as exc:  # pylint: disable=broad-except
+                latency, error = None, str(exc)
+                app.logger.error("Readiness check failed: %s", exc)
+        self.result = {
+            "checked_at": time.time(),
+            "db_latency_ms": None if latency is None else round(latency, 2),
+            "db_error": error,
+            "pool_utilization": None if utilization is None else round(utilization, 3),
+        }
+        return self.result
+
+    def report(self) -> dict:
+        """Returns the cached measurements, the error rate and the verdict"""
+        config = app.config
+        result = dict(
+            self.result or {"checked_at": 0, "db_latency_ms": None, "db_error": "not checked"}
+        )
+        result["error_rate"], result["responses"] = self.errors.rate()
+        result["error_rate"] = round(result["error_rate"], 3)
+        problems = []
+        if result["db_error"]:
+            problems.append("database unreachable")
+        elif result["db_latency_ms"] > config.get("READY_MAX_DB_LATENCY_MS", 250):
+            problems.append("database latency too high")
+        if (result.get("pool_utilization") or 0) > config.get("READY_MAX_POOL_UTILIZATION", 0.9):
+            problems.append("connection pool saturated")
+        if (
+            result["responses"] >= config.get("READY_MIN_RESPONSES", 20)
+            and result["error_rate"] > config.get("READY_MAX_ERROR_RATE", 0.2)
+        ):
+            problems.append("error rate too high")
+        if time.time() - result["checked_at"] > 3 * self.interval:
+            problems.append("readiness checks are stale")
+        result["problems"] = problems
+        result["ready"] = not problems
+        return result
+
+
+errors = ErrorRate(app.config.get("READY_ERROR_WINDOW_SECONDS", 60))
+
+_checker = None
+_checker_lock = threading.Lock()
+
+
+def get_checker() -> ReadinessChecker:
+    """Returns the worker's checker, starting it on first use (after the fork)"""
+    global _checker  # pylint: disable=global-statement
+    if _checker is None:
+        with _checker_lock:
+            if _checker is None:
+                checker = ReadinessChecker(
+                    app.config.get("READY_CHECK_INTERVAL_MS", 2000) / 1000.0, errors
+                )
+                checker.start()
+                _checker = checker
+    return _checker
+
+
+######################################################################
+# Count server errors for the readiness error rate
+######################################################################
+@app.after_request
+def record_response(response):
+    """Records whether the request ended in a server error"""
+    if request.endpoint not in PROBE_ENDPOINTS and not is_batched():
+        errors.record(response.status_code >= 500)
+    return response
@@ -0,0 +1,262 @@
+"""
+Shared Product Cache
+
+This module keeps serialized Products in a fixed-size hash table inside a
+memory-mapped file, so every gunicorn worker on the host reads the same
+warm copy at a constant memory cost. The table is direct mapped: a
+Product lives in slot ``id % slots`` and evicts whatever was there.
+
+Reads take no lock. Every slot has a sequence counter that a writer makes
+odd while it changes the slot and even again when it is done (a seqlock),
+and a reader that sees the counter move retries. Writers serialize with
+flock() across processes and a threading lock within one.
+
+Invalidation uses generation counters. Updates and deletes bump the
+Product's slot (at flush and again after the outermost commit), and clear() bumps one
+global generation that retires every slot at once. A reader that missed
+gets a token naming the generations it saw and put() refuses to store
+the row if either moved since, so a slow reader can never write back a
+row that was changed behind it.
+"""
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session, object_session
+from service import app
+from service.models import Product
+
+logger = logging.getLogger("flask.app")
+
+MAGIC = b"PRODCCH1"
+# magic, slots, slot size, global generation
+HEADER = struct.Struct("<8sIIQ")
+HEADER_SIZE = 64
+GENERATION_OFFSET = 16
+# sequence, product id, generation, payload length
+SLOT = struct.Struct("<QqQI")
+SLOT_HEADER_SIZE = 32
+SEQUENCE = struct.Struct("<Q")
+
+
+class SharedCache:
+    """A seqlocked hash table of serialized Products in a shared mmap"""
+
+    def __init__(self, path: str, slots: int = 8192, slot_size: int = 1024):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self._lock = threading.Lock()
+        size = HEADER_SIZE + slots * slot_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size, mmap.MAP_SHARED)
+            magic, table_slots, table_slot_size, _ = HEADER.unpack_from(self._map, 0)
+            if (magic, table_slots, table_slot_size) != (MAGIC, slots, slot_size):
+                self._map[:size] = bytes(size)
+                HEADER.pack_into(self._map, 0, MAGIC, slots, slot_size, 1)
+
+    def close(self):
+        """Unmaps the table (the file stays for the other workers)"""
+        self._map.close()
+        os.close(self._fd)
+
+    def _locked(self):
+        return _WriterLock(self._lock, self._fd)
+
+    def _offset(self, product_id: int) -> int:
+        return HEADER_SIZE + (product_id % self.slots) * self.slot_size
+
+    def generation(self) -> int:
+        """Returns the global generation"""
+        return SEQUENCE.unpack_from(self._map, GENERATION_OFFSET)[0]
+
+    ######################################################################
+    #  R E A D S
+    ######################################################################
+
+    def get(self, product_id: int) -> tuple:
+        """Returns (payload or None, token) for a Product
+
+        Pass the token to put() when storing the row loaded after a miss.
+        """
+        offset = self._offset(product_id)
+        generation = self.generation()
+        for _ in range(8):
+            before = SEQUENCE.unpack_from(self._map, offset)[0]
+            if before & 1:
+                continue  # a writer is in the slot
+            _, key, slot_generation, length = SLOT.unpack_from(self._map, offset)
+            payload = None
+            if key == product_id and slot_generation == generation:
+                start = offset + SLOT_HEADER_SIZE
+                payload = self._map[start:start + min(length, self.slot_size - SLOT_HEADER_SIZE)]
+            if SEQUENCE.unpack_from(self._map, offset)[0] == before:
+                return payload, (before, generation)
+        return None, None
+
+    def fetch(self, product_id: int, load) -> dict:
+        """Returns a serialized Product, calling load() and caching it on a miss"""
+        payload, token = self.get(product_id)
+        if payload is not None:
+            return json.loads(payload)
+        data = load()
+        if data is not None:
+            self.put(product_id, data, token)
+        return data
+
+    def fetch_many(self, product_ids: list, load_many) -> dict:
+        """Returns {id: serialized Product}, loading every miss in one call
+
+        :param load_many: called with the missed ids, returns {id: data}
+
+        """
+        found, tokens = {}, {}
+        for product_id in product_ids:
+            payload, token = self.get(product_id)
+            if payload is not None:
+                found[product_id] = json.loads(payload)
+            else:
+                tokens[product_id] = token
+        if tokens:
+            loaded = load_many(list(tokens))
+            for product_id, data in loaded.items():
+                self.put(product_id, data, tokens[product_id])
+            found.update(loaded)
+        return found
+
+    ######################################################################
+    #  W R I T E S
+    ######################################################################
+
+    def put(self, product_id: int, data: dict, token: tuple) -> bool:
+        """Stores a serialized Product unless its slot changed since token"""
+        payload = json.dumps(data, separators=(",", ":")).encode()
+        if token is None or len(payload) > self.slot_size - SLOT_HEADER_SIZE:
+            return False
+        sequence, generation = token
+        offset = self._offset(product_id)
+        with self._locked():
+            if SEQUENCE.unpack_from(self._map, offset)[0] != sequence:
+                return False
+            if self.generation() != generation:
+                return False
+            SEQUENCE.pack_into(self._map, offset, sequence + 1)
+            start = offset + SLOT_HEADER_SIZE
+            self._map[start:start + len(payload)] = payload
+            SLOT.pack_into(self._map, offset, sequence + 1, product_id, generation, len(payload))
+            SEQUENCE.pack_into(self._map, offset, sequence + 2)
+        return True
+
+    def invalidate(self, product_id: int):
+        """Drops a Product and retires any token taken on its slot"""
+        offset = self._offset(product_id)
+        with self._locked():
+            sequence = SEQUENCE.unpack_from(self._map, offset)[0]
+            SLOT.pack_into(self._map, offset, sequence + 1, 0, 0, 0)
+            SEQUENCE.pack_into(self._map, offset, sequence + 2)
+
+    def clear(self):
+        """Retires every cached Product by bumping the global generation"""
+        with self._locked():
+            SEQUENCE.pack_into(self._map, GENERATION_OFFSET, self.generation() + 1)
+
+
+class _WriterLock:  # pylint: disable=too-few-public-methods
+    """Holds the thread lock and an exclusive flock() on the cache file"""
+
+    def __init__(self, lock: threading.Lock, fd: int):
+        self.lock = lock
+        self.fd = fd
+
+    def __enter__(self):
+        self.lock.acquire()
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *_exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.lock.release()
+
+
+_cache = None
+
+
+def get_cache() -> SharedCache:
+    """Returns the shared cache if SHARED_CACHE_ENABLED is set, otherwise None"""
+    global _cache  # pylint: disable=global-statement
+    if not app.config.get("SHARED_CACHE_ENABLED"):
+        return None
+    if _cache is None:
+        _cache = SharedCache(
+            app.config.get("SHARED_CACHE_PATH"),
+            app.config.get("SHARED_CACHE_SLOTS", 8192),
+            app.config.get("SHARED_CACHE_SLOT_BYTES", 1024),
+        )
+        logger.info("Shared product cache mapped from %s", _cache.path)
+    return _cache
+
+
+######################################################################
+#  I N V A L I D A T I O N
+######################################################################
+def _stale(_mapper, _connection, target: Product):
+    """Drops a changed Product now and remembers to drop it again at commit"""
+    cache = get_cache()
+    if cache is None:
+        return
+    cache.invalidate(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("stale_products", set()).add(target.id)
+
+
+event.listen(Product, "after_update", _stale)
+event.listen(Product, "after_delete", _stale)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    """Readers that missed before the commit must not store the old row"""
+    stale = session.info.pop("stale_products", ())
+    if not stale:
+        return
+    connection = session.bind if isinstance(session.bind, Connection) else None
+    if connection is not None and connection.in_transaction():
+        # the session joined a caller's transaction: commit() only released a savepoint
+        connection.info.setdefault("stale_products", set()).update(stale)
+        return
+    _invalidate(stale)
+
+
+def invalidate_committed(connection: Connection):
+    """Drops the Products changed under a caller's transaction once it has committed
+
+    Sessions bound to a connection that is already in a transaction leave
+    the second invalidation to whoever commits that transaction.
+    """
+    _invalidate(connection.info.pop("stale_products", ()))
+
+
+def _invalidate(product_ids):
+    cache = get_cache() if product_ids else None
+    for product_id in product_ids:
+        cache.invalidate(product_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_rolled_back(session, _previous_transaction):
+    session.info.pop("stale_products", None)
+
+
+@event.listens_for(Engine, "rollback")
+def _invalidate_rolled_back(connection):
+    # reads inside the caller's transaction may have stored rows it never committed
+    _invalidate(connection.info.pop("stale_products", ()))
@@ -0,0 +1,63 @@
+"""
+Single Flight
+
+This module coalesces concurrent identical calls. The first caller for a
+key runs the function and every caller that arrives while it is still
+running waits for, and shares, the same result instead of repeating it.
+"""
+import threading
+
+
+class _Call:  # pylint: disable=too-few-public-methods
+    """A call in flight that followers can wait on"""
+
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and shares its result"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, timeout: float = None):
+        """Returns func() for the key, joining a call already in flight
+
+        A follower that waits longer than timeout seconds stops waiting and
+        runs func() itself. Errors raised by the leader are raised for every
+        follower.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            try:
+                call.result = func()
+            except Exception as error:
+                call.error = error
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.event.set()
+            return call.result
+
+        if not call.event.wait(timeout):
+            return func()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self) -> int:
+        """Returns the number of keys currently being computed"""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,246 @@
+"""
+Catalog Snapshot
+
+This module keeps an optional in-process, columnar copy of the live
+Products so that filtered list reads never touch the database. Each
+column is a packed ``array``: ids and prices (in integer cents) as int64,
+the Category as a uint8 code, and one flag byte per row holding the
+available and live bits. Filters are answered with vectorized masks over
+those buffers when NumPy is installed, and with a plain scan otherwise.
+
+The snapshot is refreshed incrementally from the product_change feed, so
+writes made by any worker show up within SNAPSHOT_MAX_STALENESS_MS. As a
+safety net for rows changed behind the application's back, the whole
+snapshot is also rebuilt every SNAPSHOT_RELOAD_SECONDS. The rebuild runs on
+a background thread into a new set of columns, which are swapped in once
+complete; reads are answered from the old columns in the meantime.
+"""
+import threading
+import time
+from array import array
+from decimal import Decimal
+from sqlalchemy import func
+from service import app
+from service.models import db, Category, Product, ProductChange
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+AVAILABLE = 1
+LIVE = 2
+
+# Sort keys the snapshot can order by (everything else goes to the database)
+SORTS = {None, "id", "-id", "price", "-price"}
+
+CATEGORIES = list(Category)
+CATEGORY_CODES = {category: code for code, category in enumerate(CATEGORIES)}
+
+
+def cents(price) -> int:
+    """Returns a price as an integer number of cents"""
+    return int((Decimal(str(price)) * 100).to_integral_value())
+
+
+class Columns:
+    """The column buffers of one snapshot, current up to change seq"""
+
+    def __init__(self, seq: int = 0):
+        self.ids = array("q")
+        self.prices = array("q")
+        self.categories = array("B")
+        self.flags = array("B")
+        self.rows = []
+        self.positions = {}
+        self.seq = seq
+
+    def __len__(self):
+        return sum(1 for flag in self.flags if flag & LIVE)
+
+    def apply(self, change: ProductChange):
+        """Applies one change from the feed"""
+        if change.operation in ("create", "update") and change.data:
+            self.upsert(change.data)
+        else:
+            position = self.positions.get(change.product_id)
+            if position is not None:
+                self.flags[position] &= ~LIVE & 0xFF
+        self.seq = change.seq
+
+    def upsert(self, data: dict):
+        """Adds or replaces the row of a serialized Product"""
+        flags = LIVE | (AVAILABLE if data["available"] else 0)
+        position = self.positions.get(data["id"])
+        if position is None:
+            self.positions[data["id"]] = len(self.ids)
+            self.ids.append(data["id"])
+            self.prices.append(cents(data["price"]))
+            self.categories.append(CATEGORY_CODES[Category[data["category"]]])
+            self.flags.append(flags)
+            self.rows.append(data)
+            return
+        self.prices[position] = cents(data["price"])
+        self.categories[position] = CATEGORY_CODES[Category[data["category"]]]
+        self.flags[position] = flags
+        self.rows[position] = data
+
+    def matches(self, category, available, price) -> list:
+        """Returns the positions of the matching rows, in id order"""
+        if numpy is not None:
+            return self._numpy_matches(category, available, price)
+        want = LIVE | (AVAILABLE if available else 0)
+        mask = LIVE | (AVAILABLE if available is not None else 0)
+        code = None if category is None else CATEGORY_CODES[category]
+        target = None if price is None else cents(price)
+        positions = [
+            i for i, flag in enumerate(self.flags)
+            if flag & mask == want
+            and (code is None or self.categories[i] == code)
+            and (target is None or self.prices[i] == target)
+        ]
+        positions.sort(key=self.ids.__getitem__)
+        return positions
+
+    def _numpy_matches(self, category, available, price) -> list:
+        if not self.flags:
+            return []
+        flags = numpy.frombuffer(self.flags, dtype=numpy.uint8)
+        mask = (flags & LIVE) != 0
+        if available is not None:
+            mask &= ((flags & AVAILABLE) != 0) == bool(available)
+        if category is not None:
+            mask &= numpy.frombuffer(self.categories, dtype=numpy.uint8) == CATEGORY_CODES[category]
+        if price is not None:
+            mask &= numpy.frombuffer(self.prices, dtype=numpy.int64) == cents(price)
+        positions = numpy.flatnonzero(mask)
+        ids = numpy.frombuffer(self.ids, dtype=numpy.int64)[positions]
+        # the views must be gone before the arrays can grow again
+        return positions[numpy.argsort(ids, kind="stable")].tolist()
+
+
+class CatalogSnapshot:
+    """Columnar copy of the live Products, kept current from the change feed
+
+    The lock only guards the current Columns while a read or a batch of
+    changes uses them; database reads happen outside of it.
+    """
+
+    def __init__(self, max_staleness: float = 1.0, reload_interval: float = 300.0):
+        self.max_staleness = max_staleness
+        self.reload_interval = reload_interval
+        self.refreshed = 0.0
+        self.loaded = 0.0
+        self._columns = Columns()
+        self._lock = threading.Lock()
+        self._reloading = False
+
+    def __len__(self):
+        with self._lock:
+            return len(self._columns)
+
+    ######################################################################
+    #  L O A D I N G
+    ######################################################################
+
+    def load(self):
+        """Rebuilds the snapshot from the product table and swaps it in"""
+        # changes after this point are replayed on top, which is idempotent
+        columns = Columns(db.session.query(func.coalesce(func.max(ProductChange.seq), 0)).scalar())
+        for product in Product.live().order_by(Product.id).yield_per(1000):
+            columns.upsert(product.serialize())
+        with self._lock:
+            self._columns = columns
+            self.refreshed = self.loaded = time.monotonic()
+
+    def refresh(self, force: bool = False):
+        """Applies the changes published since the last refresh
+
+        Does nothing if the snapshot was refreshed within max_staleness
+        seconds, unless force is set. The first call loads the snapshot;
+        once it is older than reload_interval it is rebuilt in the background.
+        """
+        now = time.monotonic()
+        if not self.loaded:
+            self.load()
+            return
+        if now - self.loaded > self.reload_interval:
+            self._reload_in_background()
+        if not force and now - self.refreshed < self.max_staleness:
+            return
+        columns = self._columns
+        changes = []
+        while True:
+            batch = ProductChange.since(changes[-1].seq if changes else columns.seq, 1000)
+            changes.extend(batch)
+            if len(batch) < 1000:
+                break
+        with self._lock:
+            # a reload swapped in while we read starts from its own seq
+            if self._columns is columns:
+                for change in changes:
+                    if change.seq > columns.seq:
+                        columns.apply(change)
+                self.refreshed = time.monotonic()
+
+    def _reload_in_background(self):
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, name="snapshot-reload", daemon=True).start()
+
+    def _reload(self):
+        try:
+            with app.app_context():
+                self.load()
+        except Exception as error:  # pylint: disable=broad-except
+            app.logger.error("Catalog snapshot reload failed: %s", error)
+        finally:
+            self._reloading = False
+
+    ######################################################################
+    #  Q U E R I E S
+    ######################################################################
+
+    def select(
+        self,
+        category: Category = None,
+        available: bool = None,
+        price=None,
+        sort: str = None,
+        limit: int = None,
+        fields: tuple = None,
+    ) -> list:
+        """Returns the serialized live Products that match every filter
+
+        Rows are in id order unless sort is one of SORTS.
+        """
+        with self._lock:
+            columns = self._columns
+            positions = columns.matches(category, available, price)
+            if sort in ("price", "-price"):
+                positions.sort(key=lambda i: (columns.prices[i], columns.ids[i]))
+            if sort and sort.startswith("-"):
+                positions.reverse()
+            rows = [columns.rows[i] for i in positions[:limit]]
+        if fields is None:
+            return rows
+        return [{field: row[field] for field in fields} for row in rows]
+
+
+_snapshot = None
+
+
+def get_snapshot() -> CatalogSnapshot:
+    """Returns the fresh snapshot if SNAPSHOT_ENABLED is set, otherwise None"""
+    global _snapshot  # pylint: disable=global-statement
+    if not app.config.get("SNAPSHOT_ENABLED"):
+        return None
+    if _snapshot is None:
+        _snapshot = CatalogSnapshot(
+            app.config.get("SNAPSHOT_MAX_STALENESS_MS", 1000) / 1000.0,
+            app.config.get("SNAPSHOT_RELOAD_SECONDS", 300),
+        )
+    _snapshot.refresh()
+    return _snapshot
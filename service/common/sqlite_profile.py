@@ -0,0 +1,52 @@
+"""
+SQLite Profile
+
+This module tunes an embedded SQLite database for single-node catalogs,
+where every gunicorn worker opens the same file. It runs on each new
+connection:
+
+- journal_mode=WAL, so readers never wait for the writer and the writer
+  never waits for readers
+- synchronous=NORMAL, which in WAL mode can only lose the last commits on
+  a power cut, never corrupt the file, and saves an fsync per commit
+- mmap_size and cache_size, so hot pages are read from memory
+- busy_timeout, so a writer waits for the write lock instead of failing
+
+SQLite allows one writer at a time across all processes, and SQLite's own
+write lock is what serializes the workers. pysqlite only opens a
+transaction before the first INSERT, UPDATE or DELETE, and it is told to
+open it with BEGIN IMMEDIATE. A writer therefore takes the lock before it
+has read anything, and queues for up to busy_timeout behind the current
+one. A deferred BEGIN would instead fail at once with "database is locked"
+when its read snapshot went stale. Reads run outside any transaction and
+never wait.
+"""
+from sqlalchemy import event
+
+# PRAGMA name -> value, set from the app config by configure()
+_pragmas = {}
+
+
+def configure(engine, app):
+    """Applies the profile to every new connection of a SQLite engine"""
+    if engine.dialect.name != "sqlite":
+        return
+    _pragmas.update(
+        journal_mode="WAL",
+        synchronous=app.config.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+        mmap_size=app.config.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+        cache_size=-app.config.get("SQLITE_CACHE_KB", 65536),  # negative means KiB
+        busy_timeout=app.config.get("SQLITE_BUSY_TIMEOUT_MS", 5000),
+    )
+    if not event.contains(engine, "connect", set_pragmas):
+        event.listen(engine, "connect", set_pragmas)
+        engine.dispose()  # connections opened before now get the profile too
+
+
+def set_pragmas(dbapi_connection, _connection_record):
+    """Tunes a new pysqlite connection"""
+    cursor = dbapi_connection.cursor()
+    for name, value in _pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+    dbapi_connection.isolation_level = "IMMEDIATE"
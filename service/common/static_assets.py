@@ -0,0 +1,166 @@
+"""
+Static Asset Pipeline
+
+This module content-hashes the admin UI's css and js files so they can be
+served with an immutable Cache-Control header. References in index.html
+are rewritten to the fingerprinted names and every asset is kept
+pre-gzipped in memory.
+
+``flask assets-build`` rebuilds the same output from the sources into
+``static/dist`` ahead of time; when that directory is missing the serving
+pipeline builds it in memory on first use.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+from flask import Response, request
+from service.common import status
+
+ASSET_DIRS = ("css", "js")
+ASSET_PREFIX = "assets/"
+DIST_DIR = "dist"
+MANIFEST = "manifest.json"
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def fingerprint(path: str, data: bytes) -> str:
+    """Returns the path with a content hash inserted before the extension"""
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+class Asset:  # pylint: disable=too-few-public-methods
+    """An asset held in memory together with its gzipped form"""
+
+    __slots__ = ("path", "mimetype", "data", "gzipped", "etag")
+
+    def __init__(self, path: str, data: bytes, gzipped: bytes = None):
+        self.path = path
+        self.mimetype = "text/css" if path.endswith(".css") else "application/javascript"
+        self.data = data
+        self.gzipped = gzipped if gzipped is not None else gzip.compress(data, mtime=0)
+        self.etag = path.rsplit(".", 2)[-2]
+
+
+class AssetPipeline:
+    """Holds the fingerprinted assets and the rewritten index page"""
+
+    def __init__(self, static_folder: str):
+        self.static_folder = static_folder
+        self.manifest = {}
+        self.assets = {}
+        self.index_html = b""
+        self.index_gzipped = b""
+        self.index_etag = ""
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self):
+        """Loads the pipeline from static/dist, or builds it in memory"""
+        with self._lock:
+            if self._loaded:
+                return self
+            dist = os.path.join(self.static_folder, DIST_DIR)
+            if os.path.exists(os.path.join(dist, MANIFEST)):
+                self._load_dist(dist)
+            else:
+                self._build()
+            self._loaded = True
+        return self
+
+    def build(self):
+        """Rebuilds the pipeline from the source files, ignoring any static/dist"""
+        with self._lock:
+            self.manifest, self.assets = {}, {}
+            self._build()
+            self._loaded = True
+        return self
+
+    def _build(self):
+        """Hashes and compresses every asset from the static folder"""
+        for directory in ASSET_DIRS:
+            folder = os.path.join(self.static_folder, directory)
+            if not os.path.isdir(folder):
+                continue
+            for filename in sorted(os.listdir(folder)):
+                source = f"{directory}/{filename}"
+                with open(os.path.join(folder, filename), "rb") as file:
+                    data = file.read()
+                hashed = fingerprint(source, data)
+                self.manifest[source] = hashed
+                self.assets[hashed] = Asset(hashed, data)
+        with open(os.path.join(self.static_folder, "index.html"), "rb") as file:
+            self.index_html = self.rewrite(file.read())
+        self.index_gzipped = gzip.compress(self.index_html, mtime=0)
+        self.index_etag = hashlib.sha256(self.index_html).hexdigest()[:12]
+
+    def _load_dist(self, dist: str):
+        """Reads a pipeline previously written by save()"""
+        with open(os.path.join(dist, MANIFEST), encoding="utf-8") as file:
+            self.manifest = json.load(file)
+        for hashed in self.manifest.values():
+            with open(os.path.join(dist, hashed), "rb") as file:
+                data = file.read()
+            with open(os.path.join(dist, hashed + ".gz"), "rb") as file:
+                gzipped = file.read()
+            self.assets[hashed] = Asset(hashed, data, gzipped)
+        with open(os.path.join(dist, "index.html"), "rb") as file:
+            self.index_html = file.read()
+        self.index_gzipped = gzip.compress(self.index_html, mtime=0)
+        self.index_etag = hashlib.sha256(self.index_html).hexdigest()[:12]
+
+    def rewrite(self, html: bytes) -> bytes:
+        """Points static references in the html at their fingerprinted names"""
+        for source, hashed in self.manifest.items():
+            html = html.replace(
+                f"static/{source}".encode(), f"{ASSET_PREFIX}{hashed}".encode()
+            )
+        return html
+
+    def save(self) -> str:
+        """Writes the fingerprinted assets, .gz files and manifest to static/dist
+
+        The previous build is removed first so no stale fingerprints linger.
+        """
+        dist = os.path.join(self.static_folder, DIST_DIR)
+        shutil.rmtree(dist, ignore_errors=True)
+        for asset in self.assets.values():
+            target = os.path.join(dist, asset.path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as file:
+                file.write(asset.data)
+            with open(target + ".gz", "wb") as file:
+                file.write(asset.gzipped)
+        with open(os.path.join(dist, "index.html"), "wb") as file:
+            file.write(self.index_html)
+        with open(os.path.join(dist, MANIFEST), "w", encoding="utf-8") as file:
+            json.dump(self.manifest, file, indent=2, sort_keys=True)
+        return dist
+
+    def get(self, hashed: str):
+        """Returns the Asset for a fingerprinted path or None"""
+        return self.load().assets.get(hashed)
+
+
+def send_asset(data: bytes, gzipped: bytes, mimetype: str, etag: str, cache_control: str):
+    """Builds a response for an in-memory asset
+
+    The gzipped body is sent when the client accepts it, and a matching
+    If-None-Match gets an empty 304 Not Modified.
+    """
+    use_gzip = "gzip" in request.accept_encodings
+    tag = f"{etag}-gzip" if use_gzip else etag
+    if request.if_none_match.contains(etag) or request.if_none_match.contains(f"{etag}-gzip"):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(gzipped if use_gzip else data, mimetype=mimetype)
+        if use_gzip:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(tag)
+    response.headers["Cache-Control"] = cache_control
+    response.vary.add("Accept-Encoding")
+    return response
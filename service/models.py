@@ -17,10 +17,15 @@ available (boolean) - True for products that are available for adoption
 
 """
 import logging
+from datetime import datetime
 from enum import Enum
-from decimal import Decimal
-from flask import Flask
+from decimal import Decimal, InvalidOperation
+from flask import Flask, current_app, g
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, inspect, lambda_stmt, literal, select, text, union_all
+from sqlalchemy.orm import load_only
+from service.common import prepared, sqlite_profile
+from service.common.group_commit import GroupCommitter
 
 logger = logging.getLogger("flask.app")
 
@@ -37,6 +42,79 @@ class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
+# Public sort keys mapped to the Product columns they order by
+SORT_KEYS = {"id": "id", "name": "name", "price": "price", "created": "created_at"}
+
+
+def sort_clauses(model, sort: str = None) -> tuple:
+    """Returns the ORDER BY clauses of a sort key on model, or None for no sort
+
+    The id breaks ties so pages of equal values come back in a stable order.
+    """
+    if not sort:
+        return None
+    key = sort.lstrip("-")
+    if key not in SORT_KEYS or not hasattr(model, SORT_KEYS[key]):
+        raise DataValidationError(
+            f"Invalid sort key '{key}', use one of {', '.join(SORT_KEYS)}"
+        )
+    column = getattr(model, SORT_KEYS[key])
+    if sort.startswith("-"):
+        return column.desc(), model.id.desc()
+    return column.asc(), model.id.asc()
+
+
+# Decimal places of a price read back from SQLite, which stores Numeric as a
+# float. With no precision the PostgreSQL column stays a plain NUMERIC, which
+# returns the exact value it stored
+PRICE_SCALE = 2
+
+# Fields emitted by Product.serialize(), each backed by a column of the same name
+FIELDS = ("id", "name", "description", "price", "available", "category")
+
+FIELD_SERIALIZERS = {
+    "id": lambda product: product.id,
+    "name": lambda product: product.name,
+    "description": lambda product: product.description,
+    "price": lambda product: str(product.price),
+    "available": lambda product: product.available,
+    "category": lambda product: product.category.name,  # convert enum to string
+}
+
+
+def serialize_record(record, fields: tuple = None) -> dict:
+    """Serializes anything with the FIELDS as attributes, a Product or a row of one
+
+    :param fields: optional subset of FIELDS to emit (see parse_fields)
+    :type fields: tuple
+
+    """
+    return {field: FIELD_SERIALIZERS[field](record) for field in fields or FIELDS}
+
+
+def parse_fields(fields: str) -> tuple:
+    """Parses a comma separated ?fields= value into a tuple of field names
+
+    :return: the requested fields in order, or None for every field
+    :rtype: tuple
+
+    """
+    if not fields:
+        return None
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown or not names:
+        raise DataValidationError(
+            f"Invalid fields {', '.join(unknown)}; use any of {', '.join(FIELDS)}"
+        )
+    return names
+
+
+def _live_index(name: str, *columns: str):
+    """Declares an index over the rows that are not soft deleted"""
+    return db.Index(name, *columns, postgresql_where=text("deleted_at IS NULL"))
+
+
 class Category(Enum):
     """Enumeration of valid Product Categories"""
 
@@ -62,10 +140,26 @@ class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.String(250), nullable=False)
-    price = db.Column(db.Numeric, nullable=False)
+    price = db.Column(db.Numeric(scale=PRICE_SCALE), nullable=False)
     available = db.Column(db.Boolean(), nullable=False, default=True)
+    # without a native enum type (SQLite) a CHECK constraint refuses unknown names
     category = db.Column(
-        db.Enum(Category), nullable=False, server_default=(Category.UNKNOWN.name)
+        db.Enum(Category, create_constraint=True), nullable=False, server_default=(Category.UNKNOWN.name)
+    )
+    last_modified = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
+
+    # Indexes that back the sort orders and top-N queries of the list routes
+    __table_args__ = (
+        _live_index("ix_product_name", "name", "id"),
+        _live_index("ix_product_price", "price", "id"),
+        _live_index("ix_product_created_at", "created_at", "id"),
+        _live_index("ix_product_category_price", "category", "price", "id"),
+        _live_index("ix_product_category_created_at", "category", "created_at", "id"),
+        _live_index("ix_product_available_price", "available", "price", "id"),
     )
 
     ##################################################
@@ -82,6 +176,11 @@ class Product(db.Model):
         logger.info("Creating %s", self.name)
         # id must be none to generate next primary key
         self.id = None  # pylint: disable=invalid-name
+        committer = current_app.extensions.get("group_commit")
+        if committer and not g.get("atomic_batch"):
+            # wait for the shared transaction to land (raises this row's error)
+            committer.submit(self).result()
+            return
         db.session.add(self)
         db.session.commit()
 
@@ -95,21 +194,19 @@ class Product(db.Model):
         db.session.commit()
 
     def delete(self):
-        """Removes a Product from the data store"""
+        """Soft deletes a Product; the archiver later moves it out of the table"""
         logger.info("Deleting %s", self.name)
-        db.session.delete(self)
+        self.deleted_at = datetime.utcnow()
         db.session.commit()
 
-    def serialize(self) -> dict:
-        """Serializes a Product into a dictionary"""
-        return {
-            "id": self.id,
-            "name": self.name,
-            "description": self.description,
-            "price": str(self.price),
-            "available": self.available,
-            "category": self.category.name  # convert enum to string
-        }
+    def serialize(self, fields: tuple = None) -> dict:
+        """Serializes a Product into a dictionary
+
+        :param fields: optional subset of FIELDS to emit (see parse_fields)
+        :type fields: tuple
+
+        """
+        return serialize_record(self, fields)
 
     def deserialize(self, data: dict):
         """
@@ -120,7 +217,12 @@ class Product(db.Model):
         try:
             self.name = data["name"]
             self.description = data["description"]
-            self.price = Decimal(data["price"])
+            try:
+                self.price = Decimal(data["price"])
+            except InvalidOperation as error:
+                raise DataValidationError(f"Invalid product: bad price {data['price']!r}") from error
+            if not self.price.is_finite():
+                raise DataValidationError(f"Invalid product: bad price {data['price']!r}")
             if isinstance(data["available"], bool):
                 self.available = data["available"]
             else:
@@ -155,72 +257,257 @@ class Product(db.Model):
         # This is where we initialize SQLAlchemy from the Flask app
         db.init_app(app)
         app.app_context().push()
+        sqlite_profile.configure(db.engine, app)
         db.create_all()  # make our sqlalchemy tables
+        if app.config.get("GROUP_COMMIT_ENABLED"):
+            app.extensions["group_commit"] = GroupCommitter(
+                app,
+                db,
+                max_batch=app.config.get("GROUP_COMMIT_MAX_BATCH", 64),
+                window_ms=app.config.get("GROUP_COMMIT_WINDOW_MS", 5),
+            )
 
     @classmethod
-    def all(cls) -> list:
-        """Returns all of the Products in the database"""
+    def all(cls, sort: str = None, limit: int = None, fields: tuple = None) -> list:
+        """Returns all of the Products in the database
+
+        :param sort: optional sort key, see ordered()
+        :param limit: optional maximum number of Products
+        :param fields: optional columns to load, see only()
+
+        """
         logger.info("Processing all Products")
-        return cls.query.all()
+        return cls.only(cls.ordered(cls.live(), sort, limit), fields).all()
 
     @classmethod
-    def find(cls, product_id: int):
+    def find(cls, product_id: int, fields: tuple = None):
         """Finds a Product by it's ID
 
         :param product_id: the id of the Product to find
         :type product_id: int
+        :param fields: optional columns to load, see only()
+        :type fields: tuple
 
         :return: an instance with the product_id, or None if not found
         :rtype: Product
 
         """
         logger.info("Processing lookup for id %s ...", product_id)
-        return cls.query.get(product_id)
+        if fields is not None:
+            return cls.only(cls.live().filter(cls.id == product_id), fields).first()
+        if prepared.supported(db, current_app):
+            product = db.session.identity_map.get(db.session.identity_key(cls, product_id))
+            if product is None or inspect(product).expired:
+                products = prepared.execute(db.session, cls, "product_by_id", product_id)
+                return products[0] if products else None
+        product = db.session.get(cls, product_id)
+        if product is None or product.deleted_at is not None:
+            return None
+        return product
+
+    @classmethod
+    def find_many(cls, product_ids: list, fields: tuple = None) -> tuple:
+        """Finds many Products by ID with at most one query
+
+        Products already loaded in the session are served from its identity
+        map; the rest are fetched with a single WHERE id IN (...).
+
+        :param product_ids: the ids of the Products to find
+        :type product_ids: list
+        :param fields: optional columns to load, see only()
+        :type fields: tuple
+
+        :return: the Products found in the order asked for, and the missing ids
+        :rtype: tuple
+
+        """
+        logger.info("Processing lookup for %d ids ...", len(product_ids))
+        needed = set(fields or FIELDS) | {"deleted_at"}
+        found = {}
+        for product_id in product_ids:
+            product = db.session.identity_map.get(db.session.identity_key(cls, product_id))
+            if product is not None and not needed & inspect(product).unloaded:
+                found[product_id] = product
+        remaining = [product_id for product_id in product_ids if product_id not in found]
+        if remaining:
+            query = cls.only(cls.live().filter(cls.id.in_(remaining)), fields)
+            found.update((product.id, product) for product in query)
+        live = {key: product for key, product in found.items() if product.deleted_at is None}
+        products = [live[product_id] for product_id in product_ids if product_id in live]
+        missing = [product_id for product_id in product_ids if product_id not in live]
+        return products, missing
+
+    @classmethod
+    def search(
+        cls,
+        name: str = None,
+        price: Decimal = None,
+        available: bool = None,
+        category: Category = None,
+        sort: str = None,
+        limit: int = None,
+        fields: tuple = None,
+    ) -> list:
+        """Returns the live Products matching every given filter
+
+        This is the hot path behind the list routes and the find_by_*
+        methods. The statement is built from lambdas, so SQLAlchemy caches it
+        by code location and only swaps in the new values, and a lookup on a
+        single filter with no sort, limit or fields runs as a prepared
+        statement on PostgreSQL.
+
+        :param sort: optional sort key, see ordered()
+        :param limit: optional maximum number of Products
+        :param fields: optional columns to load, see only()
+
+        """
+        if isinstance(price, str):
+            price = Decimal(price.strip(' "'))
+        lookup = cls._prepared_lookup(name, price, available, category, sort, limit, fields)
+        if lookup is not None:
+            return prepared.execute(db.session, cls, *lookup)
+        statement = cls.search_statement(name, price, available, category, sort, limit, fields)
+        return db.session.execute(statement).scalars().all()
+
+    @classmethod
+    def search_rows(
+        cls,
+        name: str = None,
+        price: Decimal = None,
+        available: bool = None,
+        category: Category = None,
+        sort: str = None,
+        limit: int = None,
+        fields: tuple = None,
+    ) -> list:
+        """Returns what search() would, as read-only rows instead of Products
+
+        For callers that only serialize the result. The rows come from a
+        Core SELECT of just the columns behind fields and are plain named
+        tuples: no instances, identity map or attribute instrumentation.
+        serialize_record() turns one into the same dictionary as serialize().
+        """
+        if isinstance(price, str):
+            price = Decimal(price.strip(' "'))
+        lookup = cls._prepared_lookup(name, price, available, category, sort, limit, fields)
+        if lookup is not None:
+            return prepared.execute_rows(db.session, cls, *lookup)
+        columns = [cls.__table__.c[field] for field in fields or FIELDS]
+        statement = lambda_stmt(lambda: select(*columns).where(cls.deleted_at.is_(None)))
+        statement = cls._filtered(statement, name, price, available, category)
+        return db.session.execute(cls._shaped(statement, sort, limit)).all()
 
     @classmethod
-    def find_by_name(cls, name: str) -> list:
+    def search_statement(
+        cls,
+        name: str = None,
+        price: Decimal = None,
+        available: bool = None,
+        category: Category = None,
+        sort: str = None,
+        limit: int = None,
+        fields: tuple = None,
+    ):
+        """Returns the cached lambda statement behind search()"""
+        statement = lambda_stmt(lambda: select(cls).where(cls.deleted_at.is_(None)))
+        statement = cls._filtered(statement, name, price, available, category)
+        return cls._shaped(statement, sort, limit, fields)
+
+    @classmethod
+    def _filtered(cls, statement, name, price, available, category):
+        """Adds the search filters that were given to a lambda statement"""
+        if name is not None:
+            statement += lambda s: s.where(cls.name == name)
+        if price is not None:
+            statement += lambda s: s.where(cls.price == price)
+        if available is not None:
+            statement += lambda s: s.where(cls.available == available)
+        if category is not None:
+            statement += lambda s: s.where(cls.category == category)
+        return statement
+
+    @classmethod
+    def _shaped(cls, statement, sort: str = None, limit: int = None, fields: tuple = None):
+        """Adds the sort, limit and fields of ordered() and only() to a lambda statement"""
+        order = cls.sort_order(sort)
+        if order is not None:
+            statement += lambda s: s.order_by(*order)
+        if limit is not None:
+            statement += lambda s: s.limit(limit)
+        if fields is not None:
+            columns = [getattr(cls, field) for field in fields]
+            statement += lambda s: s.options(load_only(*columns))
+        return statement
+
+    @classmethod
+    def _prepared_lookup(cls, name, price, available, category, sort, limit, fields) -> tuple:
+        """Returns the (prepared statement, value) that answers a search, or None"""
+        if sort is None and limit is None and fields is None and prepared.supported(db, current_app):
+            given = cls._prepared_filters(name, price, available, category)
+            if len(given) == 1:
+                return given[0]
+        return None
+
+    @classmethod
+    def _prepared_filters(cls, name, price, available, category) -> list:
+        """Returns the (prepared statement, value) of each given filter"""
+        filters = {
+            "products_by_name": name,
+            "products_by_price": price,
+            "products_by_availability": available,
+            "products_by_category": category.name if category is not None else None,
+        }
+        return [(statement, value) for statement, value in filters.items() if value is not None]
+
+    @classmethod
+    def find_by_name(cls, name: str, category: Category = None) -> list:
         """Returns all Products with the given name
 
         :param name: the name of the Products you want to match
         :type name: str
+        :param category: optionally narrows (and partition-prunes) the search
+        :type category: enum
 
         :return: a collection of Products with that name
         :rtype: list
 
         """
         logger.info("Processing name query for %s ...", name)
-        return cls.query.filter(cls.name == name)
+        return cls.search(name=name, category=category)
 
     @classmethod
-    def find_by_price(cls, price: Decimal) -> list:
+    def find_by_price(cls, price: Decimal, category: Category = None) -> list:
         """Returns all Products with the given price
 
         :param price: the price to search for
         :type name: float
+        :param category: optionally narrows (and partition-prunes) the search
+        :type category: enum
 
         :return: a collection of Products with that price
         :rtype: list
 
         """
         logger.info("Processing price query for %s ...", price)
-        price_value = price
-        if isinstance(price, str):
-            price_value = Decimal(price.strip(' "'))
-        return cls.query.filter(cls.price == price_value)
+        return cls.search(price=price, category=category)
 
     @classmethod
-    def find_by_availability(cls, available: bool = True) -> list:
+    def find_by_availability(cls, available: bool = True, category: Category = None) -> list:
         """Returns all Products by their availability
 
         :param available: True for products that are available
         :type available: str
+        :param category: optionally narrows (and partition-prunes) the search
+        :type category: enum
 
         :return: a collection of Products that are available
         :rtype: list
 
         """
         logger.info("Processing available query for %s ...", available)
-        return cls.query.filter(cls.available == available)
+        if available is None:
+            return []  # available is NOT NULL, so no product matches
+        return cls.search(available=available, category=category)
 
     @classmethod
     def find_by_category(cls, category: Category = Category.UNKNOWN) -> list:
@@ -234,4 +521,328 @@ class Product(db.Model):
 
         """
         logger.info("Processing category query for %s ...", category.name)
-        return cls.query.filter(cls.category == category)
\ No newline at end of file
+        return cls.search(category=category)
+
+    @classmethod
+    def live(cls):
+        """Returns a query over the Products that have not been deleted"""
+        return cls.query.filter(cls.deleted_at.is_(None))
+
+    @classmethod
+    def ordered(cls, query, sort: str = None, limit: int = None):
+        """Orders a query by a sort key and keeps the first limit rows
+
+        :param sort: one of id, name, price or created; prefix with - to
+            sort descending (e.g. -created for the newest first)
+        :type sort: str
+        :param limit: the number of rows to keep (top-N)
+        :type limit: int
+
+        """
+        order = cls.sort_order(sort)
+        if order is not None:
+            query = query.order_by(*order)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    @classmethod
+    def sort_order(cls, sort: str = None) -> tuple:
+        """Returns the ORDER BY clauses of a sort key, see sort_clauses()"""
+        return sort_clauses(cls, sort)
+
+    @classmethod
+    def only(cls, query, fields: tuple = None):
+        """Restricts a query to the columns behind the given fields
+
+        The primary key is always loaded; None loads every column.
+        """
+        if fields is None:
+            return query
+        return query.options(load_only(*[getattr(cls, field) for field in fields]))
+
+
+class ProductChange(db.Model):
+    """
+    Class that represents one entry in the Product change feed
+
+    Every create, update and delete of a Product appends a row with a
+    monotonically increasing sequence number. Deletes are recorded as
+    tombstones that carry no data.
+    """
+
+    __tablename__ = "product_change"
+
+    ##################################################
+    # Table Schema
+    ##################################################
+    seq = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False, index=True)
+    operation = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    data = db.Column(db.JSON, nullable=True)
+
+    def __repr__(self):
+        return f"<ProductChange {self.operation} product={self.product_id} seq=[{self.seq}]>"
+
+    def serialize(self) -> dict:
+        """Serializes a ProductChange into a dictionary"""
+        return {
+            "seq": self.seq,
+            "product_id": self.product_id,
+            "operation": self.operation,
+            "changed_at": self.changed_at.isoformat(),
+            "data": self.data,
+        }
+
+    @classmethod
+    def since(cls, seq: int, limit: int = 100) -> list:
+        """Returns up to limit changes with a sequence number after seq
+
+        :param seq: the last sequence number the caller has seen
+        :type seq: int
+
+        :return: the changes in sequence order
+        :rtype: list
+
+        """
+        logger.info("Processing changes since %s ...", seq)
+        return cls.query.filter(cls.seq > seq).order_by(cls.seq).limit(limit).all()
+
+
+class ProductArchive(db.Model):
+    """
+    Class that represents an archived Product
+
+    Deleted and long-unavailable Products are moved here by the archiver
+    so the hot product table and its indexes stay small.
+    """
+
+    __tablename__ = "product_archive"
+
+    ##################################################
+    # Table Schema
+    ##################################################
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.String(250), nullable=False)
+    price = db.Column(db.Numeric(scale=PRICE_SCALE), nullable=False)
+    available = db.Column(db.Boolean(), nullable=False)
+    category = db.Column(db.Enum(Category, create_constraint=True), nullable=False)
+    last_modified = db.Column(db.DateTime, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ProductArchive {self.name} id=[{self.id}]>"
+
+    def serialize(self, fields: tuple = None) -> dict:
+        """Serializes an archived Product like a live one, flagged as archived"""
+        data = serialize_record(self, fields)
+        if fields is None:
+            data["archived"] = True
+        return data
+
+    @classmethod
+    def all(cls, sort: str = None, limit: int = None) -> list:
+        """Returns the archived Products, by id unless another sort is given
+
+        :param sort: optional sort key, see sort_clauses(); archived rows
+            have no created timestamp, so "created" is refused
+        :param limit: optional maximum number of Products
+
+        """
+        logger.info("Processing all archived Products")
+        query = cls.query.order_by(*(sort_clauses(cls, sort) or (cls.id,)))
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
+
+    @classmethod
+    def with_products(cls, sort: str = None, limit: int = None) -> list:
+        """Returns the live and the archived Products as one list of rows
+
+        Both tables are read in one UNION ALL that the database sorts and
+        limits, so names compare in the database's collation. Each row has
+        the FIELDS and an archived flag; unsorted, live rows come first.
+
+        :param sort: optional sort key, see all()
+        :param limit: optional maximum number of rows
+
+        """
+        logger.info("Processing all live and archived Products")
+        sort_clauses(cls, sort)  # refuses the keys archived rows cannot sort by
+        live, archive = Product.__table__, cls.__table__
+        union = union_all(
+            select(*[live.c[field] for field in FIELDS], literal(False).label("archived")).where(
+                live.c.deleted_at.is_(None)
+            ),
+            select(*[archive.c[field] for field in FIELDS], literal(True).label("archived")),
+        ).subquery()
+        if sort:
+            column = union.c[SORT_KEYS[sort.lstrip("-")]]
+            order = (column.desc(), union.c.id.desc()) if sort.startswith("-") else (column, union.c.id)
+        else:
+            order = (union.c.archived, union.c.id)
+        statement = select(union).order_by(*order)
+        if limit is not None:
+            statement = statement.limit(limit)
+        return db.session.execute(statement).all()
+
+    @classmethod
+    def find(cls, product_id: int):
+        """Finds an archived Product by it's ID"""
+        logger.info("Processing archive lookup for id %s ...", product_id)
+        return db.session.get(cls, product_id)
+
+
+class IdempotencyKey(db.Model):
+    """
+    Class that represents the stored outcome of an idempotent request
+
+    A row is claimed (status is NULL) when the first request with a key
+    starts and completed with its response when it finishes, so retries
+    replay the response instead of repeating the write.
+    """
+
+    __tablename__ = "idempotency_key"
+
+    ##################################################
+    # Table Schema
+    ##################################################
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Integer, nullable=True)
+    mimetype = db.Column(db.String(100), nullable=True)
+    location = db.Column(db.String(2048), nullable=True)
+    body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey {self.key} status=[{self.status}]>"
+
+
+class Job(db.Model):
+    """
+    Class that represents a background job and its outcome
+
+    Jobs are queued by POST /jobs and claimed by a job runner, which
+    records its progress, a heartbeat and finally the result or error.
+    """
+
+    __tablename__ = "job"
+
+    STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+    FINISHED = ("succeeded", "failed", "cancelled")
+
+    ##################################################
+    # Table Schema
+    ##################################################
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default="queued", index=True)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    cancel_requested = db.Column(db.Boolean(), nullable=False, default=False)
+    worker = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<Job {self.kind} id=[{self.id}] status=[{self.status}]>"
+
+    def serialize(self) -> dict:
+        """Serializes a Job into a dictionary"""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "cancel_requested": self.cancel_requested,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    @classmethod
+    def find(cls, job_id: int):
+        """Finds a Job by it's ID"""
+        logger.info("Processing job lookup for id %s ...", job_id)
+        return db.session.get(cls, job_id)
+
+
+# pg_advisory_xact_lock key held by every transaction that publishes changes
+CHANGE_FEED_LOCK = 0x70636866
+
+
+def lock_change_feed(connection):
+    """Lets one transaction at a time publish changes, until it commits
+
+    A SERIAL value is assigned at INSERT, not at commit, so without this a
+    writer could commit seq 7 after a reader had already moved past seq 8
+    and the reader would never see it. Every writer takes the lock just
+    before it inserts a change row and keeps it to its commit, so sequence
+    numbers are handed out in commit order, while everything a writer does
+    before recording its changes still runs concurrently with the others.
+    SQLite already runs one write transaction at a time.
+    """
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SELECT pg_advisory_xact_lock({CHANGE_FEED_LOCK})")
+
+
+def record_created(connection, products: list):
+    """Appends "create" changes for rows bulk loaded without the ORM
+
+    :param products: rows with the Product columns, e.g. from INSERT ... RETURNING
+
+    """
+    if not products:
+        return
+    now = datetime.utcnow()
+    lock_change_feed(connection)
+    connection.execute(
+        ProductChange.__table__.insert(),
+        [
+            {
+                "product_id": product.id,
+                "operation": "create",
+                "changed_at": now,
+                "data": serialize_record(product),
+            }
+            for product in products
+        ],
+    )
+
+
+def _record_change(connection, product: Product, operation: str):
+    """Appends a change in the same transaction as the Product write"""
+    data = None if operation == "delete" else product.serialize()
+    lock_change_feed(connection)
+    connection.execute(
+        ProductChange.__table__.insert().values(
+            product_id=product.id, operation=operation, data=data
+        )
+    )
+
+
+@event.listens_for(Product, "after_insert")
+def _product_inserted(_mapper, connection, target):
+    _record_change(connection, target, "create")
+
+
+@event.listens_for(Product, "after_update")
+def _product_updated(_mapper, connection, target):
+    # a soft delete is published as a tombstone
+    _record_change(connection, target, "delete" if target.deleted_at else "update")
+
+
+@event.listens_for(Product, "after_delete")
+def _product_deleted(_mapper, connection, target):
+    _record_change(connection, target, "delete")
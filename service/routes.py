@@ -2,12 +2,26 @@
 """
 Product Store Service with UI
 """
-from flask import jsonify, request, abort
-from flask import url_for  # noqa: F401 pylint: disable=unused-import
-from service.models import Product
+import json
+import time
+from flask import jsonify, request, abort, Response, stream_with_context
+from flask import url_for
+from sqlalchemy.exc import SQLAlchemyError
+from service.models import db, Product, ProductArchive, Category, ProductChange, Job, SORT_KEYS, parse_fields, serialize_record
 from service.common import status  # HTTP Status Codes
+from service.common import admission, archival, compression  # noqa: F401 pylint: disable=unused-import
+from service.common import batch, bulk_io, jobs, profiler, readiness, shared_cache, snapshot
+from service.common import idempotency  # noqa: F401 pylint: disable=unused-import
+from service.common.single_flight import SingleFlight
+from service.common.static_assets import AssetPipeline, IMMUTABLE, send_asset
 from . import app
 
+# Fingerprinted css/js for the admin UI (built on first use if not prebuilt)
+assets = AssetPipeline(app.static_folder)
+
+# Concurrent identical list queries share one database call
+reads = SingleFlight()
+
 
 ######################################################################
 # H E A L T H   C H E C K
@@ -18,13 +32,33 @@ def healthcheck():
     return jsonify(status=200, message="OK"), status.HTTP_200_OK
 
 
+@app.route("/ready")
+def readiness_check():
+    """Tells the orchestrator whether this worker should receive traffic"""
+    report = readiness.get_checker().report()
+    code = status.HTTP_200_OK if report["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE
+    return jsonify(report), code
+
+
 ######################################################################
 # H O M E   P A G E
 ######################################################################
 @app.route("/")
 def index():
     """Base URL for our service"""
-    return app.send_static_file("index.html")
+    assets.load()
+    return send_asset(
+        assets.index_html, assets.index_gzipped, "text/html", assets.index_etag, "no-cache"
+    )
+
+
+@app.route("/assets/<path:filename>")
+def static_asset(filename):
+    """Serves a fingerprinted css or js file that never changes"""
+    asset = assets.get(filename)
+    if not asset:
+        abort(status.HTTP_404_NOT_FOUND, f"Asset '{filename}' was not found.")
+    return send_asset(asset.data, asset.gzipped, asset.mimetype, asset.etag, IMMUTABLE)
 
 
 ######################################################################
@@ -49,6 +83,91 @@ def check_content_type(content_type):
     )
 
 
+def include_archived() -> bool:
+    """Returns True when the request asks for archived products too"""
+    return request.args.get("include_archived", "false").lower() in ("true", "1", "yes")
+
+
+def list_options() -> tuple:
+    """Returns the validated ?sort=, ?limit= and ?fields= of a list request"""
+    sort = request.args.get("sort")
+    if sort and sort.lstrip("-") not in SORT_KEYS:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            f"Invalid sort '{sort}', use one of {', '.join(SORT_KEYS)} (prefix - for descending).",
+        )
+    limit = request.args.get("limit", type=int)
+    if limit is not None and limit < 1:
+        abort(status.HTTP_400_BAD_REQUEST, "limit must be a positive integer.")
+    return sort, limit, parse_fields(request.args.get("fields"))
+
+
+def parse_ids(ids: str) -> list:
+    """Returns the distinct ids of a ?ids=1,5,9 multi-get in request order"""
+    try:
+        product_ids = list(dict.fromkeys(int(value) for value in ids.split(",") if value.strip()))
+    except ValueError:
+        abort(status.HTTP_400_BAD_REQUEST, "ids must be a comma separated list of integers.")
+    limit = app.config.get("MULTI_GET_MAX_IDS", 100)
+    if not product_ids or len(product_ids) > limit:
+        abort(status.HTTP_400_BAD_REQUEST, f"ids must list between 1 and {limit} products.")
+    return product_ids
+
+
+def multi_get(product_ids: list, fields: tuple) -> dict:
+    """Returns the products asked for in order, and the ids that were missing"""
+    cache = shared_cache.get_cache()
+    if cache is None:
+        products, missing = Product.find_many(product_ids, fields)
+        return {"products": [product.serialize(fields) for product in products], "missing": missing}
+
+    def load_many(ids):
+        return {product.id: product.serialize() for product in Product.find_many(ids)[0]}
+
+    found = cache.fetch_many(product_ids, load_many)
+    return {
+        "products": [select_fields(found[i], fields) for i in product_ids if i in found],
+        "missing": [i for i in product_ids if i not in found],
+    }
+
+
+def serialized(product) -> dict:
+    """Serializes a Product, or returns None when there is none"""
+    return product.serialize() if product is not None else None
+
+
+def select_fields(data: dict, fields: tuple) -> dict:
+    """Keeps the requested fields of a serialized Product"""
+    return data if fields is None else {field: data[field] for field in fields}
+
+
+def from_snapshot(sort, limit, fields, **filters) -> list:
+    """Answers a list read from the catalog snapshot, or None to ask the database"""
+    catalog = snapshot.get_snapshot()
+    if catalog is None or sort not in snapshot.SORTS:
+        return None
+    return catalog.select(sort=sort, limit=limit, fields=fields, **filters)
+
+
+def with_archived(sort, limit, fields) -> list:
+    """Lists live and archived products as one list, sorted and limited as a whole"""
+    products = []
+    for row in ProductArchive.with_products(sort, limit):
+        data = serialize_record(row, fields)
+        if fields is None and row.archived:
+            data["archived"] = True
+        products.append(data)
+    return products
+
+
+def coalesced(key, query, fields: tuple = None) -> list:
+    """Serializes the rows of query() once for all concurrent requests with the same key"""
+    timeout = app.config.get("SINGLE_FLIGHT_TIMEOUT_MS", 1000) / 1000.0
+    return reads.do(
+        key + (fields,), lambda: [serialize_record(row, fields) for row in query()], timeout
+    )
+
+
 ######################################################################
 # C R E A T E   A   N E W   P R O D U C T
 ######################################################################
@@ -81,40 +200,78 @@ def create_products():
 # List all products
 @app.route("/products", methods=["GET"])
 def list_products():
-    products = Product.all()
-    return jsonify([product.serialize() for product in products]), 200
+    sort, limit, fields = list_options()
+    if "ids" in request.args:
+        return jsonify(multi_get(parse_ids(request.args["ids"]), fields)), 200
+    if include_archived():
+        return jsonify(with_archived(sort, limit, fields)), 200
+    products = from_snapshot(sort, limit, fields)
+    if products is None:
+        products = coalesced(("all", sort, limit), lambda: Product.search_rows(sort=sort, limit=limit, fields=fields), fields)
+    return jsonify(products), 200
 
 # List products by name
 @app.route("/products/name/<string:name>", methods=["GET"])
 def list_products_by_name(name):
-    products = Product.find_by_name(name)  # Retrieves products filtered by name
+    sort, limit, fields = list_options()
+    products = coalesced(
+        ("name", name, sort, limit),
+        lambda: Product.search_rows(name=name, sort=sort, limit=limit, fields=fields),
+        fields,
+    )
     if not products:
         abort(404, f"No products found with name '{name}'.")
-    return jsonify([product.serialize() for product in products]), 200
+    return jsonify(products), 200
 
 # List products by category
 @app.route("/products/category/<string:category>", methods=["GET"])
 def list_products_by_category(category):
-    products = Product.find_by_category(category)  # Retrieves products filtered by category
+    try:
+        category_value = Category[category.upper()]
+    except KeyError:
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid category '{category}'.")
+    sort, limit, fields = list_options()
+    products = from_snapshot(sort, limit, fields, category=category_value)
+    if products is None:
+        products = coalesced(
+            ("category", category_value, sort, limit),
+            lambda: Product.search_rows(category=category_value, sort=sort, limit=limit, fields=fields),
+            fields,
+        )
     if not products:
         abort(404, f"No products found in category '{category}'.")
-    return jsonify([product.serialize() for product in products]), 200
+    return jsonify(products), 200
 
 # Get a single product by ID
 @app.route("/products/<int:product_id>", methods=["GET"])
 def get_product(product_id):
-    product = Product.find(product_id)
+    fields = parse_fields(request.args.get("fields"))
+    cache = shared_cache.get_cache()
+    if cache is not None:
+        data = cache.fetch(product_id, lambda: serialized(Product.find(product_id)))
+        if data is not None:
+            return jsonify(select_fields(data, fields)), 200
+    product = Product.find(product_id, fields) if cache is None else None
+    if not product and include_archived():
+        product = ProductArchive.find(product_id)
     if not product:
         abort(404, f"Product with ID {product_id} not found.")
-    return jsonify(product.serialize()), 200
+    return jsonify(product.serialize(fields)), 200
 
 # List products by availability
 @app.route("/products/availability/<bool:available>", methods=["GET"])
 def list_products_by_availability(available):
-    products = Product.find_by_availability(available)  # Retrieves products filtered by availability
+    sort, limit, fields = list_options()
+    products = from_snapshot(sort, limit, fields, available=available)
+    if products is None:
+        products = coalesced(
+            ("available", available, sort, limit),
+            lambda: Product.search_rows(available=available, sort=sort, limit=limit, fields=fields),
+            fields,
+        )
     if not products:
         abort(404, f"No products found with availability status '{available}'.")
-    return jsonify([product.serialize() for product in products]), 200
+    return jsonify(products), 200
 
 # Create a new product
 @app.route("/products", methods=["POST"])
@@ -145,3 +302,199 @@ def delete_product(product_id):
     product.delete()
     return "", 204
 
+
+######################################################################
+# S T R E A M I N G   I N G E S T
+######################################################################
+def ingest_results(records, chunk_size: int):
+    """Creates the valid records chunk by chunk, yielding one NDJSON result per line"""
+    created = rejected = 0
+    for chunk in bulk_io.chunked(records, chunk_size):
+        rows, errors = bulk_io.validate_chunk(chunk)
+        try:
+            created += bulk_io.insert_rows(rows)
+            db.session.commit()
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            app.logger.error("Ingest stopped at line %s: %s", chunk[0][0], error)
+            yield json.dumps({"line": chunk[0][0], "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                              "error": "Could not save the records from this line on."}) + "\n"
+            break
+        rejected += len(errors)
+        for line_no, _ in chunk:
+            if line_no in errors:
+                result = {"line": line_no, "status": status.HTTP_400_BAD_REQUEST, "error": errors[line_no]}
+            else:
+                result = {"line": line_no, "status": status.HTTP_201_CREATED}
+            yield json.dumps(result) + "\n"
+    yield json.dumps({"created": created, "rejected": rejected}) + "\n"
+
+
+@app.route("/products/ingest", methods=["POST"])
+def ingest_products():
+    """
+    Creates Products from an NDJSON body of any size
+    The body is read one line at a time and committed every INGEST_CHUNK_SIZE
+    records; the response streams back a result for every line
+    """
+    check_content_type("application/x-ndjson")
+    lines = bulk_io.read_lines(request.stream, app.config.get("INGEST_MAX_LINE_BYTES", 65536))
+    results = ingest_results(bulk_io.parse_lines(lines), app.config.get("INGEST_CHUNK_SIZE", 1000))
+    return Response(stream_with_context(results), mimetype="application/x-ndjson")
+
+
+######################################################################
+# B A T C H   R E Q U E S T S
+######################################################################
+@app.route("/batch", methods=["POST"])
+def run_batch():
+    """
+    Runs many API calls in one round trip
+    The body is {"operations": [{"method", "path", "body"}, ...], "atomic": false}
+    """
+    check_content_type("application/json")
+    operations, atomic = batch.parse_operations(request.get_json())
+    app.logger.info("Running a batch of %d operations (atomic=%s)", len(operations), atomic)
+    results, committed = batch.run_batch(operations, atomic)
+    return jsonify(results=results, committed=committed), status.HTTP_200_OK
+
+
+######################################################################
+# B A C K G R O U N D   J O B S
+######################################################################
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    """
+    Queues a background job
+    The body is {"kind": "archive" | "reindex" | "catalog-stats", "params": {...}}
+    """
+    check_content_type("application/json")
+    kind, params = jobs.validate(request.get_json())
+    jobs.get_runner()
+    job = jobs.submit(kind, params)
+    app.logger.info("Queued job %s (%s)", job.id, kind)
+    location_url = url_for("get_job", job_id=job.id, _external=True)
+    return jsonify(job.serialize()), status.HTTP_202_ACCEPTED, {"Location": location_url}
+
+
+@app.route("/jobs/<int:job_id>", methods=["GET"])
+def get_job(job_id):
+    """Returns a job's status, progress and, once finished, its result"""
+    jobs.get_runner()
+    job = Job.find(job_id)
+    if not job:
+        abort(status.HTTP_404_NOT_FOUND, f"Job with ID {job_id} not found.")
+    return jsonify(job.serialize()), status.HTTP_200_OK
+
+
+@app.route("/jobs/<int:job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    """
+    Cancels a job
+    A queued job is cancelled at once (200); a running one is asked to stop
+    at its next progress report (202)
+    """
+    outcome = jobs.cancel(job_id)
+    job = Job.find(job_id)
+    if not job:
+        abort(status.HTTP_404_NOT_FOUND, f"Job with ID {job_id} not found.")
+    if outcome is None:
+        abort(status.HTTP_409_CONFLICT, f"Job {job_id} has already {job.status}.")
+    app.logger.info("Job %s %s", job_id, outcome)
+    code = status.HTTP_200_OK if outcome == "cancelled" else status.HTTP_202_ACCEPTED
+    return jsonify(job.serialize()), code
+
+
+######################################################################
+# P R O F I L I N G
+######################################################################
+@app.route("/debug/profile", methods=["GET"])
+def profile_worker():
+    """
+    Samples this worker's request threads for ?seconds=N
+    Returns collapsed stacks per endpoint, as JSON or with ?format=collapsed
+    as plain flamegraph input
+    """
+    profiler.check_access()
+    limit = app.config.get("PROFILER_MAX_SECONDS", 30)
+    seconds = request.args.get("seconds", 5, type=float)
+    if not 0 < seconds <= limit:
+        abort(status.HTTP_400_BAD_REQUEST, f"seconds must be between 0 and {limit}.")
+    interval = app.config.get("PROFILER_INTERVAL_MS", 10) / 1000.0
+    result = profiler.profile(seconds, interval)
+    if result is None:
+        abort(status.HTTP_409_CONFLICT, "A profile is already running in this worker.")
+    if request.args.get("format") == "collapsed":
+        return Response("\n".join(result.collapsed()) + "\n", mimetype="text/plain")
+    return jsonify(result.summary()), status.HTTP_200_OK
+
+
+######################################################################
+# C H A N G E   F E E D
+######################################################################
+def poll_changes(since: int, limit: int, wait: float) -> list:
+    """Returns changes after since, polling for up to wait seconds"""
+    deadline = time.monotonic() + wait
+    poll = app.config.get("CHANGE_FEED_POLL_MS", 500) / 1000.0
+    changes = ProductChange.since(since, limit)
+    while not changes and time.monotonic() < deadline:
+        db.session.rollback()  # hand the connection back while we sleep
+        time.sleep(min(poll, max(deadline - time.monotonic(), 0)))
+        changes = ProductChange.since(since, limit)
+    return changes
+
+
+@app.route("/products/changes", methods=["GET"])
+def list_product_changes():
+    """
+    Returns the Product changes after ?since=<seq>
+    With ?wait=<seconds> the request long-polls until a change arrives
+    """
+    since = request.args.get("since", 0, type=int)
+    page_size = app.config.get("CHANGE_FEED_PAGE_SIZE", 100)
+    limit = max(1, min(request.args.get("limit", page_size, type=int), page_size))
+    wait = min(request.args.get("wait", 0, type=float), app.config.get("CHANGE_FEED_MAX_WAIT", 30))
+    changes = poll_changes(since, limit + 1, max(wait, 0))
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    return (
+        jsonify(
+            changes=[change.serialize() for change in changes],
+            next=changes[-1].seq if changes else since,
+            has_more=has_more,
+        ),
+        status.HTTP_200_OK,
+    )
+
+
+@app.route("/products/changes/stream", methods=["GET"])
+def stream_product_changes():
+    """
+    Pushes Product changes as Server-Sent Events
+    Clients resume from the Last-Event-ID header (or ?since=<seq>)
+    """
+    since = request.headers.get("Last-Event-ID", type=int)
+    if since is None:
+        since = request.args.get("since", 0, type=int)
+    page_size = app.config.get("CHANGE_FEED_PAGE_SIZE", 100)
+    duration = app.config.get("CHANGE_FEED_STREAM_SECONDS", 300)
+
+    def generate(last_seq):
+        deadline = time.monotonic() + duration
+        yield "retry: 1000\n\n"
+        while time.monotonic() < deadline:
+            changes = poll_changes(last_seq, page_size, min(15, deadline - time.monotonic()))
+            if not changes:
+                yield ": keep-alive\n\n"
+                continue
+            for change in changes:
+                last_seq = change.seq
+                yield f"id: {change.seq}\nevent: change\ndata: {json.dumps(change.serialize())}\n\n"
+        db.session.rollback()
+
+    return Response(
+        stream_with_context(generate(since)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
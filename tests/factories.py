@@ -1,6 +1,6 @@
 import factory
 from factory.fuzzy import FuzzyChoice
-from service.models import Product
+from service.models import Product, Category
 
 class ProductFactory(factory.Factory):
     """Factory for creating fake products for testing"""
@@ -11,6 +11,6 @@ class ProductFactory(factory.Factory):
     # If the Product model auto-generates the 'id', you can omit this.
     name = factory.Faker("word")
     description = factory.Faker("sentence", nb_words=10)
-    price = factory.Faker("pyfloat", left_digits=2, right_digits=2, positive=True, min_value=1.0, max_value=1000.0)
+    price = factory.Faker("pyfloat", left_digits=3, right_digits=2, positive=True, min_value=1.0, max_value=999.99)
     available = FuzzyChoice(choices=[True, False])
-    category = factory.Faker("word")
+    category = FuzzyChoice(choices=list(Category))
@@ -0,0 +1,85 @@
+"""
+Test cases for Admission Control
+
+Test cases can be run with:
+    nosetests
+    coverage report -m
+
+"""
+import logging
+from unittest import TestCase
+from unittest.mock import patch
+from werkzeug.middleware.proxy_fix import ProxyFix
+from service import app
+from service.common import admission, status
+from service.common.admission import AdmissionController, TokenBucket
+
+
+######################################################################
+#  A D M I S S I O N   C O N T R O L   T E S T   C A S E S
+######################################################################
+class TestAdmissionControl(TestCase):
+    """Test Cases for admission control and load shedding"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This runs once before the entire test suite"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """This runs before each test"""
+        self.client = app.test_client()
+
+    def test_token_bucket(self):
+        """It should allow a burst and then ask the client to wait"""
+        bucket = TokenBucket(rate=1, capacity=2)
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertGreater(bucket.take(), 0)
+
+    def test_concurrency_limit(self):
+        """It should refuse a slot once the limit is reached"""
+        controller = AdmissionController(0, 1, max_concurrency=1, queue_timeout_ms=0)
+        self.assertTrue(controller.acquire())
+        self.assertFalse(controller.acquire())
+        controller.release()
+        self.assertTrue(controller.acquire())
+
+    def test_rate_limited_with_retry_after(self):
+        """It should return 429 with Retry-After when the bucket is empty"""
+        controller = AdmissionController(1, 0, max_concurrency=1, queue_timeout_ms=0)
+        with patch.object(admission, "_controller", controller):
+            resp = self.client.get("/products")
+        self.assertEqual(resp.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(resp.headers["Retry-After"], "1")
+        self.assertEqual(resp.get_json()["error"], "Too Many Requests")
+
+    def test_shed_when_saturated(self):
+        """It should return 503 with Retry-After when no slot frees up"""
+        controller = AdmissionController(0, 1, max_concurrency=1, queue_timeout_ms=0)
+        controller.acquire()
+        with patch.object(admission, "_controller", controller):
+            resp = self.client.get("/products")
+            health = self.client.get("/health")
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(resp.headers["Retry-After"], "1")
+        self.assertEqual(health.status_code, status.HTTP_200_OK)
+
+    def test_spoofed_forwarded_for(self):
+        """It should not give a new bucket to a client that spoofs X-Forwarded-For"""
+        controller = AdmissionController(1, 1, max_concurrency=1, queue_timeout_ms=0)
+        proxied = ProxyFix(app.wsgi_app, x_for=1)
+        with patch.object(admission, "_controller", controller), patch.object(app, "wsgi_app", proxied):
+            # admission runs before the 404 is raised; the trusted proxy
+            # appends the address it saw to what the client sent
+            first = self.client.get(
+                "/unknown", headers={"X-Forwarded-For": "10.0.0.1, 203.0.113.7"}
+            )
+            second = self.client.get(
+                "/unknown", headers={"X-Forwarded-For": "10.0.0.2, 203.0.113.7"}
+            )
+            other = self.client.get("/unknown", headers={"X-Forwarded-For": "198.51.100.9"})
+        self.assertEqual(first.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(second.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(other.status_code, status.HTTP_404_NOT_FOUND)
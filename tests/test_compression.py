@@ -0,0 +1,85 @@
+"""
+Test cases for Response Compression
+
+Test cases can be run with:
+    nosetests
+    coverage report -m
+
+"""
+import gzip
+import logging
+from unittest import TestCase
+from service import app
+from service.common import compression
+from service.common.compression import choose_encoding
+
+
+######################################################################
+#  C O M P R E S S I O N   T E S T   C A S E S
+######################################################################
+class TestCompression(TestCase):
+    """Test Cases for the compression middleware"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This runs once before the entire test suite"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """This runs before each test"""
+        self.client = app.test_client()
+        compression.cache.clear()
+
+    def test_choose_encoding(self):
+        """It should pick the best accepted encoding"""
+        self.assertEqual(choose_encoding("gzip, deflate"), "gzip")
+        self.assertIsNone(choose_encoding("deflate"))
+        self.assertIsNone(choose_encoding("gzip;q=0"))
+        self.assertIsNone(choose_encoding(""))
+        self.assertIn(choose_encoding("*"), compression.ENCODERS)
+
+    def test_small_response_not_compressed(self):
+        """It should leave small responses alone"""
+        resp = self.client.get("/health", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("Content-Encoding", resp.headers)
+        self.assertIn("Accept-Encoding", resp.headers["Vary"])
+
+    def test_large_response_compressed_and_cached(self):
+        """It should gzip large JSON and reuse the cached body"""
+        payload = [{"name": f"product {i}", "category": "FOOD"} for i in range(200)]
+        headers = {"Accept-Encoding": "gzip"}
+        with app.test_request_context("/products", headers=headers):
+            resp = compression.compress_response(app.json.response(payload))
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertTrue(resp.headers["ETag"].endswith('-gzip"'))
+        body = gzip.decompress(resp.get_data())
+        self.assertEqual(app.json.loads(body), payload)
+        self.assertEqual(len(compression.cache._entries), 1)  # pylint: disable=protected-access
+
+        with app.test_request_context("/products", headers=headers):
+            again = compression.compress_response(app.json.response(payload))
+        self.assertEqual(again.get_data(), resp.get_data())
+        self.assertEqual(again.headers["ETag"], resp.headers["ETag"])
+
+    def test_not_modified(self):
+        """It should answer 304 when If-None-Match matches the encoded ETag"""
+        payload = [{"name": f"product {i}", "category": "FOOD"} for i in range(200)]
+        with app.test_request_context("/products", headers={"Accept-Encoding": "gzip"}):
+            resp = compression.compress_response(app.json.response(payload))
+        headers = {"Accept-Encoding": "gzip", "If-None-Match": resp.headers["ETag"]}
+        with app.test_request_context("/products", headers=headers):
+            again = compression.compress_response(app.json.response(payload))
+        self.assertEqual(again.status_code, 304)
+        self.assertNotIn("Content-Encoding", again.headers)
+        self.assertEqual(again.headers["ETag"], resp.headers["ETag"])
+
+    def test_weak_etag_stays_weak(self):
+        """It should keep a weak ETag weak when tagging the encoded body"""
+        payload = [{"name": f"product {i}", "category": "FOOD"} for i in range(200)]
+        with app.test_request_context("/products", headers={"Accept-Encoding": "gzip"}):
+            response = app.json.response(payload)
+            response.set_etag("catalog", weak=True)
+            resp = compression.compress_response(response)
+        self.assertEqual(resp.headers["ETag"], 'W/"catalog-gzip"')
@@ -0,0 +1,91 @@
+"""
+Test cases for Log Handlers
+
+Test cases can be run with:
+    nosetests
+    coverage report -m
+
+"""
+import json
+import logging
+from unittest import TestCase
+from flask import Flask
+from service.common.log_handlers import (
+    init_logging,
+    stop_logging,
+    JsonFormatter,
+    SamplingFilter,
+    TruncatingFilter,
+)
+
+
+def make_record(name="service", level=logging.INFO, msg="hello %s", args=("world",)):
+    """Builds a log record for the filters"""
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+######################################################################
+#  L O G   H A N D L E R   T E S T   C A S E S
+######################################################################
+class TestLogHandlers(TestCase):
+    """Test Cases for the logging pipeline"""
+
+    def test_sampling_filter(self):
+        """It should drop sampled INFO records but never warnings"""
+        sampler = SamplingFilter({"service": 0.0, "service.routes": 1.0})
+        self.assertFalse(sampler.filter(make_record("service")))
+        self.assertTrue(sampler.filter(make_record("service.routes")))
+        self.assertTrue(sampler.filter(make_record("sqlalchemy")))
+        self.assertTrue(sampler.filter(make_record("service", logging.ERROR)))
+
+    def test_truncating_filter(self):
+        """It should truncate long messages"""
+        record = make_record(args=("x" * 100,))
+        TruncatingFilter(20).filter(record)
+        self.assertEqual(record.getMessage(), "hello xxxxxxxxxxxxxx... [106 chars]")
+        record = make_record()
+        TruncatingFilter(20).filter(record)
+        self.assertEqual(record.getMessage(), "hello world")
+
+    def test_json_formatter(self):
+        """It should format a record as JSON"""
+        entry = json.loads(JsonFormatter().format(make_record()))
+        self.assertEqual(entry["message"], "hello world")
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["logger"], "service")
+
+    def test_init_logging(self):
+        """It should write records through a queue listener"""
+        records = []
+        target = logging.getLogger("test.gunicorn")
+        target.setLevel(logging.INFO)
+        handler = logging.Handler()
+        handler.emit = records.append
+        target.handlers = [handler]
+        app = Flask("test_logging")
+        app.config["LOG_FORMAT"] = "json"
+        init_logging(app, "test.gunicorn")
+        app.logger.info("Processing: %s", "y" * 1000)
+        stop_logging(app)
+        self.assertEqual(len(records), 2)
+        message = json.loads(handler.format(records[1]))["message"]
+        self.assertTrue(message.endswith("[1012 chars]"))
+
+    def test_sampled_library_logger(self):
+        """It should apply sampling rates to loggers other than the app's"""
+        records = []
+        target = logging.getLogger("test.gunicorn.sampled")
+        target.setLevel(logging.INFO)
+        handler = logging.Handler()
+        handler.emit = records.append
+        target.handlers = [handler]
+        library = logging.getLogger("test.library.engine")
+        library.setLevel(logging.INFO)
+        app = Flask("test_sampled_logging")
+        app.config["LOG_SAMPLE_RATES"] = {"test.library": 0.0}
+        init_logging(app, "test.gunicorn.sampled")
+        library.info("dropped")
+        library.warning("kept")
+        stop_logging(app)
+        self.assertEqual([record.getMessage() for record in records[1:]], ["kept"])
+        library.handlers, library.propagate = [], True
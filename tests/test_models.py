@@ -130,7 +130,7 @@ class TestProductModel(unittest.TestCase):
         db.session.commit()
 
         # Verify the product is deleted by attempting to fetch it from the database
-        deleted_product = Product.query.get(product.id)
+        deleted_product = Product.find(product.id)
         self.assertIsNone(deleted_product)
 #list all products
     def test_list_all_products(self):
@@ -0,0 +1,104 @@
+"""
+Test cases for the sampling profiler
+
+Test cases can be run with:
+    nosetests
+    coverage report -m
+
+While debugging just these tests it's convenient to use this:
+    nosetests --stop tests/test_profiler.py:TestProfiler
+
+"""
+import logging
+import threading
+import unittest
+from service.common import status, profiler
+from service import app, config
+
+
+def busy_loop(stop: threading.Event):
+    """Burns CPU until told to stop"""
+    while not stop.is_set():
+        sum(range(1000))
+
+
+######################################################################
+#  P R O F I L E R   T E S T   C A S E S
+######################################################################
+class TestProfiler(unittest.TestCase):
+    """Test Cases for the /debug/profile sampler"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This runs once before the entire test suite"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """This runs before each test"""
+        self.client = app.test_client()
+        app.config["PROFILER_ENABLED"] = True
+        app.config["PROFILER_TOKEN"] = "secret"
+
+    def tearDown(self):
+        """This runs after each test"""
+        app.config["PROFILER_ENABLED"] = config.PROFILER_ENABLED
+        app.config["PROFILER_TOKEN"] = config.PROFILER_TOKEN
+
+    def _profile_busy_thread(self, seconds=0.2):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,))
+        worker.start()
+        profiler._active[worker.ident] = "list_products"  # pylint: disable=protected-access
+        try:
+            return profiler.profile(seconds, 0.005)
+        finally:
+            stop.set()
+            worker.join()
+            profiler._active.pop(worker.ident, None)  # pylint: disable=protected-access
+
+    def test_samples_request_threads(self):
+        """It should attribute collapsed stacks to the thread's endpoint"""
+        result = self._profile_busy_thread()
+        self.assertGreater(result.samples, 5)
+        self.assertEqual(list(result.endpoints()), ["list_products"])
+        line = result.collapsed()[0]
+        self.assertTrue(line.startswith("list_products;"))
+        self.assertIn("tests.test_profiler:busy_loop", line)
+        self.assertTrue(line.rsplit(" ", 1)[1].isdigit())
+        functions = {entry["function"] for entry in result.top()}
+        self.assertIn("tests.test_profiler:busy_loop", functions)
+
+    def test_one_profile_at_a_time(self):
+        """It should refuse a second concurrent profile"""
+        with profiler._profile_lock:  # pylint: disable=protected-access
+            self.assertIsNone(profiler.profile(0.01, 0.005))
+            resp = self.client.get(
+                "/debug/profile", query_string={"seconds": 0.01}, headers={"X-Profiler-Token": "secret"}
+            )
+            self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+
+    def test_endpoint(self):
+        """It should return the summary and the collapsed stacks"""
+        headers = {"X-Profiler-Token": "secret"}
+        resp = self.client.get("/debug/profile", query_string={"seconds": 0.05}, headers=headers)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertGreater(data["samples"], 0)
+        self.assertIn("collapsed", data)
+        resp = self.client.get(
+            "/debug/profile", query_string={"seconds": 0.05, "format": "collapsed"}, headers=headers
+        )
+        self.assertEqual(resp.mimetype, "text/plain")
+
+    def test_guarded(self):
+        """It should hide when disabled and require the token"""
+        resp = self.client.get("/debug/profile", query_string={"seconds": 0.01})
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+        resp = self.client.get(
+            "/debug/profile", query_string={"seconds": 999}, headers={"X-Profiler-Token": "secret"}
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        app.config["PROFILER_ENABLED"] = False
+        resp = self.client.get("/debug/profile", headers={"X-Profiler-Token": "secret"})
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
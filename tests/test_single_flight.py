@@ -0,0 +1,81 @@
+"""
+Test cases for Single Flight
+
+Test cases can be run with:
+    nosetests
+    coverage report -m
+
+"""
+import threading
+import time
+from unittest import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from service.common.single_flight import SingleFlight
+
+
+######################################################################
+#  S I N G L E   F L I G H T   T E S T   C A S E S
+######################################################################
+class TestSingleFlight(TestCase):
+    """Test Cases for request coalescing"""
+
+    def setUp(self):
+        """This runs before each test"""
+        self.flight = SingleFlight()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def slow_query(self):
+        """Blocks until released and counts its calls"""
+        self.calls += 1
+        self.release.wait(5)
+        return ["result"]
+
+    def test_concurrent_calls_share_result(self):
+        """It should run one call for many concurrent identical requests"""
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(self.flight.do, "key", self.slow_query, 5) for _ in range(8)]
+            time.sleep(0.1)  # let every caller join the call in flight
+            self.release.set()
+            results = [future.result() for future in futures]
+        self.assertEqual(results, [["result"]] * 8)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.flight.in_flight(), 0)
+
+    def test_errors_are_shared(self):
+        """It should raise the leader's error for its followers and forget the key"""
+        def failing():
+            self.release.wait(5)
+            raise ValueError("boom")
+
+        joined = threading.Barrier(2)
+
+        def follow():
+            joined.wait(5)
+            return self.flight.do("key", lambda: "own", timeout=5)
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(self.flight.do, "key", failing)
+            while self.flight.in_flight() == 0:
+                pass
+            follower = pool.submit(follow)
+            joined.wait(5)
+            time.sleep(0.1)  # let the follower join the call in flight
+            self.release.set()
+            with self.assertRaises(ValueError) as raised:
+                leader.result()
+            with self.assertRaises(ValueError) as shared:
+                follower.result()
+        self.assertIs(shared.exception, raised.exception)
+        self.assertEqual(self.flight.in_flight(), 0)
+        self.assertEqual(self.flight.do("key", lambda: 42), 42)
+
+    def test_follower_timeout(self):
+        """It should run the call itself when the wait times out"""
+        leader = threading.Thread(target=self.flight.do, args=("key", self.slow_query))
+        leader.start()
+        while self.flight.in_flight() == 0:
+            pass
+        self.assertEqual(self.flight.do("key", lambda: "own", timeout=0.01), "own")
+        self.release.set()
+        leader.join()
@@ -0,0 +1,99 @@
+"""
+Test cases for the Static Asset Pipeline
+
+Test cases can be run with:
+    nosetests
+    coverage report -m
+
+"""
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from service import app
+from service.common import status
+from service.common.static_assets import AssetPipeline, IMMUTABLE
+
+
+######################################################################
+#  S T A T I C   A S S E T   T E S T   C A S E S
+######################################################################
+class TestStaticAssets(TestCase):
+    """Test Cases for fingerprinted static assets"""
+
+    @classmethod
+    def setUpClass(cls):
+        """This runs once before the entire test suite"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """This runs before each test"""
+        self.client = app.test_client()
+        self.pipeline = AssetPipeline(app.static_folder).load()
+
+    def test_fingerprinted_references(self):
+        """It should rewrite index.html to the fingerprinted asset names"""
+        hashed = self.pipeline.manifest["js/rest_api.js"]
+        self.assertRegex(hashed, r"^js/rest_api\.[0-9a-f]{12}\.js$")
+        self.assertIn(f"assets/{hashed}".encode(), self.pipeline.index_html)
+        self.assertNotIn(b"static/js/rest_api.js", self.pipeline.index_html)
+
+    def test_save_and_load_dist(self):
+        """It should load the same manifest from a prebuilt dist folder"""
+        folder = tempfile.mkdtemp()
+        try:
+            shutil.copytree(app.static_folder, folder, dirs_exist_ok=True)
+            AssetPipeline(folder).load().save()
+            prebuilt = AssetPipeline(folder).load()
+            self.assertEqual(prebuilt.manifest, self.pipeline.manifest)
+            self.assertEqual(prebuilt.index_html, self.pipeline.index_html)
+        finally:
+            shutil.rmtree(folder)
+
+    def test_rebuild_after_edit(self):
+        """It should rehash edited sources instead of reusing an old dist"""
+        folder = tempfile.mkdtemp()
+        try:
+            shutil.copytree(app.static_folder, folder, dirs_exist_ok=True)
+            AssetPipeline(folder).build().save()
+            old = AssetPipeline(folder).load().manifest["js/rest_api.js"]
+            with open(f"{folder}/js/rest_api.js", "a", encoding="utf-8") as file:
+                file.write("\n// edited\n")
+            AssetPipeline(folder).build().save()
+            rebuilt = AssetPipeline(folder).load()
+            self.assertNotEqual(rebuilt.manifest["js/rest_api.js"], old)
+            self.assertIsNone(rebuilt.get(old))
+            self.assertFalse(os.path.exists(f"{folder}/dist/{old}"))
+        finally:
+            shutil.rmtree(folder)
+
+    def test_serve_immutable_asset(self):
+        """It should serve an asset gzipped with an immutable Cache-Control"""
+        hashed = self.pipeline.manifest["js/rest_api.js"]
+        resp = self.client.get(f"/assets/{hashed}", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.headers["Cache-Control"], IMMUTABLE)
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(resp.data), self.pipeline.assets[hashed].data)
+
+        etag = resp.headers["ETag"]
+        resp = self.client.get(f"/assets/{hashed}", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(resp.data, b"")
+
+    def test_asset_not_found(self):
+        """It should return 404 for an unknown asset"""
+        resp = self.client.get("/assets/js/missing.0000.js")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_index_page(self):
+        """It should serve the rewritten index page with revalidation"""
+        resp = self.client.get("/")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.headers["Cache-Control"], "no-cache")
+        self.assertEqual(resp.data, self.pipeline.index_html)
+        resp = self.client.get("/", headers={"If-None-Match": resp.headers["ETag"]})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)